@@ -0,0 +1 @@
+"""Benchmarks reproducibles del flujo detección → base de datos → mapa."""
@@ -0,0 +1,26 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIRS = ("iguana_images", "saved_sightings")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+
+
+def fixture_images(limit=None):
+    """Lista, en orden estable, las imágenes de ejemplo incluidas en el repositorio."""
+    images = []
+    for folder in FIXTURE_DIRS:
+        folder_path = os.path.join(BASE_DIR, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(folder_path, filename))
+
+    return images[:limit] if limit else images
+
+
+def decode_image(path):
+    """Decodifica una imagen como lo hace la aplicación (BGR con OpenCV)."""
+    import cv2
+
+    return cv2.imread(path)
@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import statistics
+from datetime import datetime
+
+import core
+import geo
+from benchmarks.fixtures import fixture_images, decode_image
+from benchmarks.stub_detector import StubDetector
+from benchmarks.synthetic_db import cached_archive, create_archive
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "iguanapp_bench")
+
+# Registro de benchmarks: nombre -> función(contexto) que regresa {caso: mediciones}
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registra una función de benchmark bajo el nombre indicado."""
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+def measure(fn, repeats, warmup=1, per_call=1):
+    """Ejecuta `fn` varias veces y regresa estadísticas en milisegundos."""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000 / per_call)
+
+    return {
+        'median_ms': statistics.median(timings),
+        'min_ms': min(timings),
+        'max_ms': max(timings),
+        'repeats': repeats,
+    }
+
+
+@benchmark("decode")
+def bench_decode(ctx):
+    """Decodificación de las imágenes de ejemplo con OpenCV."""
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        return {'decode': {'skipped': "OpenCV no está instalado"}}
+
+    images = fixture_images()
+    return {'decode': measure(lambda: [decode_image(path) for path in images],
+                              ctx.repeats, per_call=len(images))}
+
+
+@benchmark("postprocess")
+def bench_postprocess(ctx):
+    """Conversión de los resultados del detector en el resultado de la aplicación."""
+    cases = {}
+    image = _blank_image()
+    for boxes in (1, 10, 100):
+        detector = StubDetector(boxes=boxes, seed=ctx.seed)
+        results = detector(image)
+        cases[f"postprocess[boxes={boxes}]"] = measure(
+            lambda: core.summarize_detections(core.parse_detections(results)),
+            ctx.repeats, per_call=1)
+    return cases
+
+
+@benchmark("detect")
+def bench_detect(ctx):
+    """Detección completa con el detector sustituto y latencia configurable."""
+    detector = StubDetector(latency_ms=ctx.stub_latency_ms, boxes=ctx.stub_boxes, seed=ctx.seed)
+    image = _blank_image()
+    return {f"detect[latency={ctx.stub_latency_ms}ms]": measure(
+        lambda: core.run_detection(detector, image), ctx.repeats)}
+
+
+@benchmark("db_insert")
+def bench_db_insert(ctx):
+    """Inserción de avistamientos uno por uno, como lo hace `save_sighting`."""
+    db_path = os.path.join(ctx.cache_dir, "insert_bench.db")
+    create_archive(db_path, 0)
+    inserts = 200
+
+    def insert_batch():
+        for i in range(inserts):
+            core.insert_sighting(db_path, 8.9, -79.5, "original.jpg", "saved.jpg", 0.9, 1)
+
+    result = measure(insert_batch, ctx.repeats, per_call=inserts)
+    os.remove(db_path)
+    return {'db_insert': result}
+
+
+@benchmark("db_query")
+def bench_db_query(ctx):
+    """Consultas de `show_all_sightings` y de la línea de tiempo sobre archivos sintéticos."""
+    cases = {}
+    for size in ctx.sizes:
+        db_path = cached_archive(ctx.cache_dir, size, ctx.seed)
+        cases[f"db_query_all[n={size}]"] = measure(
+            lambda: core.fetch_sightings(db_path), ctx.repeats)
+        cases[f"db_timeline[n={size}]"] = measure(
+            lambda: core.fetch_timeline_frames(db_path, "Mes"), ctx.repeats)
+    return cases
+
+
+@benchmark("map")
+def bench_map(ctx):
+    """Generación del HTML de los mapas de `show_all_sightings` y de la línea de tiempo."""
+    cases = {}
+    html_path = os.path.join(ctx.cache_dir, "map_bench.html")
+    for size in ctx.sizes:
+        db_path = cached_archive(ctx.cache_dir, size, ctx.seed)
+
+        # El mapa con un marcador por avistamiento no es viable en archivos enormes
+        if size <= ctx.map_max:
+            sightings = core.fetch_sightings(db_path)
+            cases[f"map_markers[n={size}]"] = measure(
+                lambda: core.render_map(core.build_sightings_map(sightings), html_path),
+                ctx.repeats, warmup=0)
+
+        labels, frames = core.fetch_timeline_frames(db_path, "Mes")
+        cases[f"map_timeline[n={size}]"] = measure(
+            lambda: core.render_map(core.build_timeline_map(labels, frames, "Mes"), html_path),
+            ctx.repeats, warmup=0)
+    return cases
+
+
+@benchmark("prefilter")
+def bench_prefilter(ctx):
+    """Costo del prefiltro de cuadros vacíos frente a la pasada del modelo."""
+    from prefilter import PrefilterCascade
+
+    cascade = PrefilterCascade()
+    image = _blank_image(1920, 1080)
+    # Fondo confirmado vacío, como después de una pasada del modelo sin detecciones
+    cascade.record_result(image, "bench", False)
+    return {'prefilter[1920x1080]': measure(lambda: cascade.should_skip(image, "bench"), ctx.repeats)}
+
+
+@benchmark("geo")
+def bench_geo(ctx):
+    """Validación masiva de coordenadas contra el contorno de Panamá."""
+    import numpy as np
+
+    validator = geo.get_validator()
+    cases = {}
+    rng = np.random.default_rng(ctx.seed)
+    for size in ctx.sizes:
+        lat = rng.uniform(7.0, 10.0, size)
+        lon = rng.uniform(-83.5, -76.5, size)
+        cases[f"geo_validate[n={size}]"] = measure(lambda: validator.validate(lat, lon), ctx.repeats)
+    return cases
+
+
+@benchmark("hotspots")
+def bench_hotspots(ctx):
+    """Agrupamiento de zonas críticas sobre los archivos sintéticos."""
+    from hotspots import HotspotEngine
+
+    cases = {}
+    for size in ctx.sizes:
+        db_path = cached_archive(ctx.cache_dir, size, ctx.seed)
+        cases[f"hotspots[n={size}]"] = measure(
+            lambda: HotspotEngine(eps_km=1.0, eps_days=90).update_from_db(db_path),
+            ctx.repeats, warmup=0)
+    return cases
+
+
+def _blank_image(width=640, height=480):
+    import numpy as np
+
+    return np.zeros((height, width, 3), dtype=np.uint8)
+
+
+def run(ctx, only=None):
+    """Ejecuta los benchmarks seleccionados y regresa el reporte completo."""
+    results = {}
+    for name, fn in BENCHMARKS.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        print(f"Ejecutando {name}...")
+        results.update(fn(ctx))
+
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': list(ctx.sizes),
+            'repeats': ctx.repeats,
+            'seed': ctx.seed,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Compara contra una línea base y regresa la lista de regresiones."""
+    regressions = []
+    print(f"\n{'Caso':<34}{'base ms':>12}{'actual ms':>12}{'cambio':>10}")
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or 'median_ms' not in current or 'median_ms' not in previous:
+            continue
+
+        ratio = current['median_ms'] / previous['median_ms'] if previous['median_ms'] else 1.0
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+            flag = "  <-- regresión"
+        print(f"{name:<34}{previous['median_ms']:>12.3f}{current['median_ms']:>12.3f}"
+              f"{(ratio - 1) * 100:>+9.1f}%{flag}")
+
+    return regressions
+
+
+def print_report(report):
+    print(f"\n{'Caso':<34}{'mediana ms':>12}{'mín ms':>12}")
+    for name, result in report['results'].items():
+        if 'skipped' in result:
+            print(f"{name:<34}  omitido: {result['skipped']}")
+        else:
+            print(f"{name:<34}{result['median_ms']:>12.3f}{result['min_ms']:>12.3f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del flujo de avistamientos")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Tamaños de los archivos sintéticos, separados por comas (1000 a 1000000)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="Prefijos de benchmarks a ejecutar, separados por comas")
+    parser.add_argument("--map-max", type=int, default=10000,
+                        help="Tamaño máximo para el mapa con un marcador por avistamiento")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--stub-boxes", type=int, default=1)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Carpeta para los archivos sintéticos generados")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="Regenera los archivos sintéticos")
+    parser.add_argument("--output", help="Guarda los resultados en este archivo JSON")
+    parser.add_argument("--baseline", help="Archivo JSON con la línea base para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Aumento relativo permitido antes de marcar regresión")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size]
+    args.only = args.only.split(",") if args.only else None
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.clear_cache and os.path.isdir(args.cache_dir):
+        shutil.rmtree(args.cache_dir)
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    report = run(args, args.only)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones por encima de {args.tolerance * 100:.0f}%")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import time
+import random
+import numpy as np
+
+
+class StubBox:
+    """Caja con la misma forma que las de ultralytics (conf, cls, xyxy)."""
+
+    def __init__(self, confidence, class_id, bbox):
+        self.conf = np.array([confidence], dtype=np.float32)
+        self.cls = np.array([class_id], dtype=np.float32)
+        self.xyxy = np.array([bbox], dtype=np.float32)
+
+
+class StubResult:
+    """Resultado de una imagen, equivalente a `ultralytics.engine.results.Results`."""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubDetector:
+    """Detector determinista que reemplaza a YOLO en los benchmarks.
+
+    La latencia simula el tiempo de la pasada del modelo y `boxes` la cantidad
+    de detecciones por imagen. Con la misma semilla siempre produce las mismas cajas.
+    """
+
+    def __init__(self, latency_ms=0.0, boxes=1, seed=0, min_confidence=0.5):
+        self.latency_ms = latency_ms
+        self.boxes = boxes
+        self.seed = seed
+        self.min_confidence = min_confidence
+        self.calls = 0
+
+    def __call__(self, images):
+        batch = images if isinstance(images, list) else [images]
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        results = [self._predict(image, index) for index, image in enumerate(batch)]
+        self.calls += 1
+        return results
+
+    def _predict(self, image, index):
+        """Genera cajas deterministas dentro de los límites de la imagen."""
+        height, width = image.shape[:2] if hasattr(image, "shape") else (640, 640)
+        rng = random.Random(self.seed * 100003 + self.calls * 1009 + index)
+
+        boxes = []
+        for _ in range(self.boxes):
+            x1 = rng.uniform(0, width * 0.7)
+            y1 = rng.uniform(0, height * 0.7)
+            x2 = min(width, x1 + rng.uniform(width * 0.1, width * 0.3))
+            y2 = min(height, y1 + rng.uniform(height * 0.1, height * 0.3))
+            confidence = rng.uniform(self.min_confidence, 0.99)
+            boxes.append(StubBox(confidence, 0, [x1, y1, x2, y2]))
+
+        return StubResult(boxes)
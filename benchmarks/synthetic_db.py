@@ -0,0 +1,94 @@
+import os
+import random
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+import core
+from benchmarks.fixtures import fixture_images
+
+# Zonas con avistamientos frecuentes (lat, lon, dispersión en grados)
+HOTSPOTS = [
+    (8.98, -79.52, 0.08),   # Ciudad de Panamá
+    (8.11, -80.98, 0.05),   # Santiago de Veraguas
+    (9.35, -79.90, 0.05),   # Colón
+    (8.43, -82.43, 0.06),   # David
+    (7.95, -80.43, 0.05),   # Chitré
+    (9.34, -82.24, 0.04),   # Bocas del Toro
+]
+START_DATE = datetime(2024, 1, 1)
+DAYS = 730
+
+
+def generate_rows(count, seed=0):
+    """Genera filas deterministas para la tabla `sightings`."""
+    rng = random.Random(seed)
+    images = fixture_images() or ["iguana.jpg"]
+
+    for i in range(count):
+        lat, lon, spread = HOTSPOTS[rng.randrange(len(HOTSPOTS))]
+        timestamp = START_DATE + timedelta(seconds=rng.randrange(DAYS * 86400))
+        image_path = images[i % len(images)]
+        yield (
+            round(rng.gauss(lat, spread), 6),
+            round(rng.gauss(lon, spread), 6),
+            image_path,
+            image_path,
+            round(rng.uniform(0.4, 0.99), 4),
+            rng.choice((1, 1, 1, 2, 2, 3)),
+            timestamp.isoformat(),
+        )
+
+
+def create_archive(db_path, count, seed=0, chunk_size=50000):
+    """Crea (o reemplaza) un archivo de avistamientos sintético con `count` filas.
+
+    Se construye en un archivo temporal y solo se mueve a `db_path` al terminar,
+    así una generación interrumpida nunca deja un archivo incompleto en la caché.
+    """
+    partial_path = db_path + ".partial"
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    core.init_database(partial_path)
+
+    conn = sqlite3.connect(partial_path)
+    try:
+        rows = generate_rows(count, seed)
+        while True:
+            chunk = [row for _, row in zip(range(chunk_size), rows)]
+            if not chunk:
+                break
+            conn.executemany(core.INSERT_SIGHTING_SQL, chunk)
+            conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(partial_path)
+        raise
+    conn.close()
+
+    os.replace(partial_path, db_path)
+    return db_path
+
+
+def cached_archive(cache_dir, count, seed=0):
+    """Regresa un archivo sintético reutilizable, generándolo solo si no existe."""
+    os.makedirs(cache_dir, exist_ok=True)
+    db_path = os.path.join(cache_dir, f"sightings_{count}_{seed}.db")
+    if not os.path.exists(db_path):
+        create_archive(db_path, count, seed)
+    return db_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un archivo sintético de avistamientos")
+    parser.add_argument("db_path", help="Ruta del archivo SQLite a crear")
+    parser.add_argument("--rows", type=int, default=1000, help="Cantidad de avistamientos")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    create_archive(args.db_path, args.rows, args.seed)
+    print(f"Archivo sintético con {args.rows} avistamientos creado en {args.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+import os
+import time
+import uuid
+import sqlite3
+from datetime import date, datetime, timedelta
+import folium
+from folium import plugins
+from metrics import metrics
+
+# Centro aproximado de Panamá para los mapas generales
+PANAMA_CENTER = [8.9943, -79.5188]
+
+# Pasos disponibles para la línea de tiempo. Cada expresión agrupa la marca de
+# tiempo directamente en SQLite, así nunca se interpretan las fechas en Python.
+TIMELINE_STEPS = {
+    "Día": "date(timestamp)",
+    "Semana": "date(timestamp, '-6 days', 'weekday 1')",
+    "Mes": "strftime('%Y-%m-01', timestamp)",
+}
+
+INSERT_SIGHTING_SQL = '''
+INSERT INTO sightings (latitude, longitude, original_image_path, saved_image_path,
+                    detection_confidence, detections_count, timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Columnas que se agregan con ALTER TABLE a bases de datos existentes
+SIGHTING_MIGRATIONS = (
+    ("model_version", "TEXT"),
+    ("rescored_at", "TEXT"),
+)
+
+# JavaScript para mostrar las coordenadas al hacer click en el mapa
+CLICK_SCRIPT = """
+<script>
+function onMapClick(e) {
+    var lat = e.latlng.lat.toFixed(6);
+    var lng = e.latlng.lng.toFixed(6);
+
+    // Crear popup con las coordenadas
+    var popup = L.popup()
+        .setLatLng(e.latlng)
+        .setContent('<b>Coordenadas:</b><br>Latitud: ' + lat + '<br>Longitud: ' + lng)
+        .openOn(this);
+
+    console.log('Latitud: ' + lat + ', Longitud: ' + lng);
+}
+
+// Esperar a que el mapa se cargue
+document.addEventListener('DOMContentLoaded', function() {
+    setTimeout(function() {
+        var mapId = Object.keys(window).find(key => key.startsWith('map_'));
+        if (mapId && window[mapId]) {
+            window[mapId].on('click', onMapClick);
+        }
+    }, 100);
+});
+</script>
+"""
+
+
+# Modelo
+def load_model(model_path):
+    """Carga el modelo YOLO; ultralytics se importa solo cuando hace falta."""
+    from ultralytics import YOLO
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Modelo no encontrado en: {model_path}")
+    return YOLO(model_path)
+
+
+def parse_detections(results):
+    """Convierte los resultados de YOLO en una lista de detecciones."""
+    detections = []
+    with metrics.stage("postprocess"):
+        for result in results:
+            boxes = result.boxes
+            if boxes is not None:
+                for box in boxes:
+                    detections.append({
+                        'confidence': float(box.conf[0]),
+                        'class_id': int(box.cls[0]),
+                        'bbox': box.xyxy[0].tolist()
+                    })
+    return detections
+
+
+def summarize_detections(detections):
+    """Resume las detecciones en el diccionario de resultado que usa la aplicación."""
+    if not detections:
+        return {
+            'is_iguana': False,
+            'confidence': 0.0,
+            'detections_count': 0,
+            'all_detections': []
+        }
+
+    best_detection = max(detections, key=lambda x: x['confidence'])
+    return {
+        'is_iguana': True,
+        'confidence': best_detection['confidence'],
+        'detections_count': len(detections),
+        'all_detections': detections
+    }
+
+
+def run_detection(model, image, prefilter=None, source=None):
+    """Ejecuta el modelo sobre una imagen ya decodificada y resume el resultado.
+
+    Si se indica un `prefilter`, los cuadros que descarta no pasan por el modelo.
+    """
+    if prefilter is not None and prefilter.should_skip(image, source):
+        result = summarize_detections([])
+        result['prefiltered'] = True
+        return result
+
+    start = time.perf_counter()
+    with metrics.stage("inference"):
+        results = model(image)
+    if prefilter is not None:
+        prefilter.record_inference(time.perf_counter() - start)
+
+    detections = parse_detections(results)
+    metrics.increment("images_processed")
+    metrics.increment("detections", len(detections))
+    result = summarize_detections(detections)
+    if prefilter is not None:
+        prefilter.record_result(image, source, result['is_iguana'])
+    return result
+
+
+def run_detection_batch(model, images, prefilter=None, sources=None):
+    """Ejecuta el modelo una sola vez sobre varias imágenes y resume cada resultado."""
+    if not images:
+        return []
+
+    summaries = [None] * len(images)
+    pending = list(range(len(images)))
+    if prefilter is not None:
+        sources = sources or [None] * len(images)
+        pending = []
+        for i, (image, source) in enumerate(zip(images, sources)):
+            if prefilter.should_skip(image, source):
+                summaries[i] = summarize_detections([])
+                summaries[i]['prefiltered'] = True
+            else:
+                pending.append(i)
+
+    if pending:
+        start = time.perf_counter()
+        with metrics.stage("inference_batch"):
+            results = model([images[i] for i in pending])
+        if prefilter is not None:
+            prefilter.record_inference(time.perf_counter() - start, len(pending))
+
+        for i, result in zip(pending, results):
+            summaries[i] = summarize_detections(parse_detections([result]))
+            if prefilter is not None:
+                prefilter.record_result(images[i], sources[i], summaries[i]['is_iguana'])
+        metrics.increment("images_processed", len(pending))
+        metrics.increment("detections", sum(summaries[i]['detections_count'] for i in pending))
+
+    return summaries
+
+
+# Imágenes
+def new_saved_image_path(saved_images_dir, source_path):
+    """Genera una ruta única en la carpeta de avistamientos para una copia de la imagen."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    unique_id = str(uuid.uuid4())[:8]
+    file_extension = os.path.splitext(source_path)[1]
+    return os.path.join(saved_images_dir, f"iguana_{timestamp}_{unique_id}{file_extension}")
+
+
+def _dms_to_degrees(values, ref):
+    """Convierte grados, minutos y segundos EXIF a grados decimales."""
+    degrees, minutes, seconds = (float(v) for v in values)
+    value = degrees + minutes / 60 + seconds / 3600
+    return -value if ref in ("S", "W") else value
+
+
+def read_gps_coordinates(image_path):
+    """Lee las coordenadas GPS del EXIF de la imagen; regresa (lat, lon) o None."""
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        gps = img.getexif().get_ifd(0x8825)
+
+    # Etiquetas GPS: 1/2 latitud (referencia/valor), 3/4 longitud (referencia/valor)
+    if not gps or 2 not in gps or 4 not in gps:
+        return None
+    try:
+        return _dms_to_degrees(gps[2], gps.get(1, "N")), _dms_to_degrees(gps[4], gps.get(3, "E"))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def read_capture_time(image_path):
+    """Lee la fecha de captura (EXIF DateTimeOriginal) en formato ISO; regresa None si no existe."""
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        exif = img.getexif()
+        # 0x9003 DateTimeOriginal (sub-IFD Exif); 0x0132 DateTime como respaldo
+        value = exif.get_ifd(0x8769).get(0x9003) or exif.get(0x0132)
+
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value.strip("\x00 "), "%Y:%m:%d %H:%M:%S").isoformat()
+    except ValueError:
+        return None
+
+
+# Base de datos
+def init_database(db_path):
+    """Inicializa la base de datos y crea la tabla si no existe."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Se crea una tabla para los avistamientos en la base de datos (sino existe)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sightings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        original_image_path TEXT NOT NULL,
+        saved_image_path TEXT NOT NULL,
+        detection_confidence REAL,
+        detections_count INTEGER,
+        timestamp TEXT
+    )
+    ''')
+
+    # Índice para las consultas ordenadas o agrupadas por fecha
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sightings_timestamp ON sightings (timestamp)
+    ''')
+
+    # Columnas agregadas después: versión del modelo que calculó la puntuación
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(sightings)")}
+    for column, column_type in SIGHTING_MIGRATIONS:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE sightings ADD COLUMN {column} {column_type}")
+
+    conn.commit()
+    conn.close()
+
+
+def insert_sighting(db_path, lat, lon, original_image_path, saved_image_path,
+                    confidence, detections_count, timestamp=None):
+    """Guarda un avistamiento en la base de datos y regresa su id."""
+    with metrics.stage("db_insert"):
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute(INSERT_SIGHTING_SQL, (
+            lat, lon, original_image_path, saved_image_path,
+            confidence, detections_count,
+            timestamp or datetime.now().isoformat()
+        ))
+        sighting_id = cursor.lastrowid
+
+        conn.commit()
+        conn.close()
+    metrics.increment("sightings_saved")
+    return sighting_id
+
+
+def fetch_sightings(db_path):
+    """Obtiene todos los avistamientos, del más reciente al más antiguo."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    with metrics.stage("db_query"):
+        cursor.execute("""
+            SELECT latitude, longitude, timestamp, detection_confidence,
+                   detections_count, saved_image_path,
+                   strftime('%d/%m/%Y %H:%M', timestamp) AS formatted_date
+            FROM sightings
+            ORDER BY timestamp DESC
+        """)
+        sightings = cursor.fetchall()
+
+    conn.close()
+    return sightings
+
+
+def query_sightings(db_path, since=None, limit=100, offset=0):
+    """Consulta paginada de avistamientos como diccionarios, del más reciente al más antiguo."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+
+    with metrics.stage("db_query"):
+        rows = conn.execute("""
+            SELECT id, latitude, longitude, saved_image_path, detection_confidence,
+                   detections_count, timestamp
+            FROM sightings
+            WHERE ? IS NULL OR timestamp >= ?
+            ORDER BY timestamp DESC
+            LIMIT ? OFFSET ?
+        """, (since, since, limit, offset)).fetchall()
+
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def fetch_timeline_frames(db_path, step, cell_deg=0.01):
+    """Agrupa los avistamientos por intervalo de tiempo y celda en SQLite."""
+    bucket_expr = TIMELINE_STEPS[step]
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # La agregación se hace en la base de datos: solo regresan filas por intervalo y celda
+    with metrics.stage("db_query"):
+        cursor.execute(f"""
+            SELECT {bucket_expr} AS bucket,
+                   ROUND(latitude / ?) * ? AS cell_lat,
+                   ROUND(longitude / ?) * ? AS cell_lon,
+                   COUNT(*) AS sightings_count,
+                   SUM(detections_count) AS iguanas_count
+            FROM sightings
+            WHERE timestamp IS NOT NULL
+            GROUP BY bucket, cell_lat, cell_lon
+            HAVING bucket IS NOT NULL
+            ORDER BY bucket
+        """, (cell_deg, cell_deg, cell_deg, cell_deg))
+        rows = cursor.fetchall()
+
+    conn.close()
+
+    # Construir un cuadro por intervalo con los puntos [lat, lon, peso]
+    points = {}
+    max_weight = max((row[4] or row[3] for row in rows), default=1)
+    for bucket, cell_lat, cell_lon, sightings_count, iguanas_count in rows:
+        weight = (iguanas_count or sightings_count) / max_weight
+        points.setdefault(bucket, []).append([round(cell_lat, 6), round(cell_lon, 6), weight])
+
+    # Los intervalos sin avistamientos quedan como cuadros vacíos para que la
+    # animación avance a ritmo constante
+    labels = []
+    frames = []
+    if rows:
+        bucket, last = rows[0][0], rows[-1][0]
+        while bucket <= last:
+            labels.append(bucket)
+            frames.append(points.get(bucket, []))
+            bucket = _next_bucket(bucket, step)
+
+    return labels, frames
+
+
+def _next_bucket(bucket, step):
+    """Etiqueta del intervalo siguiente (las etiquetas son fechas ISO)."""
+    day = date.fromisoformat(bucket)
+    if step == "Mes":
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1).isoformat()
+    return (day + timedelta(days=7 if step == "Semana" else 1)).isoformat()
+
+
+# Mapas
+def create_interactive_map(center_location, zoom_start=10):
+    """Crea un mapa interactivo con funcionalidades adicionales incluyendo popup de coordenadas."""
+    m = folium.Map(location=center_location, zoom_start=zoom_start)
+    m.get_root().html.add_child(folium.Element(CLICK_SCRIPT))
+    return m
+
+
+def build_sightings_map(sightings):
+    """Crea el mapa con un marcador por avistamiento y el panel de estadísticas."""
+    m = create_interactive_map(PANAMA_CENTER, zoom_start=8)
+
+    # Añadir marcadores para todos los avistamientos
+    for i, (lat, lon, timestamp, confidence, count, image_path, formatted_date) in enumerate(sightings):
+        # La fecha ya viene formateada desde SQLite
+        if not formatted_date:
+            formatted_date = (timestamp or "").split('T')[0]
+
+        # Crear contenido del popup
+        popup_html = f"""
+        <div style='width: 280px; text-align: center;'>
+            <h4 style='margin: 5px 0; color: #2E7D32;'>🦎 Avistamiento #{i+1}</h4>
+            <hr style='margin: 5px 0;'>
+            <table style='width: 100%; font-size: 12px;'>
+                <tr><td><b>📅Fecha:</b></td><td>{formatted_date}</td></tr>
+                <tr><td><b>📍 Coordenadas:</b></td><td>{lat:.6f}, {lon:.6f}</td></tr>
+                <tr><td><b>🎯 Confianza:</b></td><td>{confidence*100:.1f}%</td></tr>
+                <tr><td><b>🔢 Cantidad:</b></td><td>{count}</td></tr>
+            </table>
+        """
+
+        # Agregar imagen si existe
+        if image_path and os.path.exists(image_path):
+            # Convertir ruta a URL file://
+            file_url = image_path.replace("\\", "/")
+            popup_html += f"""
+            <hr style='margin: 10px 0;'>
+            <img src="file:///{file_url}"
+                 width="240" height="180"
+                 style="border-radius: 8px; border: 2px solid #4CAF50;">
+            """
+        else:
+            popup_html += "<br><i>🚫 Imagen no disponible</i>"
+
+        popup_html += "</div>"
+
+        # Determinar color del marcador basado en confianza
+        if confidence >= 0.8:
+            marker_color = "green"
+            icon_name = "leaf"
+        elif confidence >= 0.6:
+            marker_color = "orange"
+            icon_name = "exclamation-triangle"
+        else:
+            marker_color = "red"
+            icon_name = "question"
+
+        # Crear popup
+        popup = folium.Popup(popup_html, max_width=300)
+
+        # Añadir marcador
+        folium.Marker(
+            location=[lat, lon],
+            popup=popup,
+            tooltip=f"Avistamiento {formatted_date} - {confidence*100:.1f}%",
+            icon=folium.Icon(color=marker_color, icon=icon_name, prefix='fa')
+        ).add_to(m)
+
+    # Agregar información estadística
+    total_sightings = len(sightings)
+    avg_confidence = sum(s[3] for s in sightings) / total_sightings if total_sightings else 0.0
+    total_iguanas = sum(s[4] for s in sightings)
+
+    stats_html = f"""
+    <div style='position: fixed;
+                top: 10px; left: 10px;
+                background: rgba(255,255,255,0.9);
+                padding: 10px;
+                border-radius: 8px;
+                border: 2px solid #4CAF50;
+                font-family: Arial;
+                z-index: 1000;'>
+        <h4 style='margin: 0 0 10px 0; color: #2E7D32;'>📊 Estadísticas</h4>
+        <div style='font-size: 14px;'>
+            <div>🏷️ <b>Total avistamientos:</b> {total_sightings}</div>
+            <div>🦎 <b>Total iguanas:</b> {total_iguanas}</div>
+            <div>📈 <b>Confianza promedio:</b> {avg_confidence*100:.1f}%</div>
+        </div>
+    </div>
+    """
+
+    m.get_root().html.add_child(folium.Element(stats_html))
+    return m
+
+
+def build_timeline_map(labels, frames, step):
+    """Crea el mapa de calor animado con un cuadro por intervalo de tiempo."""
+    m = create_interactive_map(PANAMA_CENTER, zoom_start=8)
+
+    plugins.HeatMapWithTime(
+        frames,
+        index=labels,
+        name=f"Avistamientos por {step.lower()}",
+        radius=25,
+        max_opacity=0.8,
+        auto_play=True,
+    ).add_to(m)
+
+    return m
+
+
+def render_map(m, path):
+    """Escribe el mapa como HTML en la ruta indicada."""
+    with metrics.stage("map_render"):
+        m.save(path)
@@ -0,0 +1,305 @@
+import numpy as np
+
+# Contorno simplificado de Panamá (lon, lat), con una precisión de pocos kilómetros,
+# dividido en tramos de costa y de frontera terrestre. Los tramos comparten sus
+# extremos: costa del Caribe desde la desembocadura del Sixaola hasta el Cabo
+# Tiburón, frontera con Colombia por la Serranía del Darién, costa del Pacífico
+# hasta Punta Burica y frontera con Costa Rica.
+CARIBBEAN_COAST = [
+    (-82.563, 9.566), (-82.38, 9.43), (-82.25, 9.33), (-82.10, 9.25), (-81.80, 9.25),
+    (-81.55, 9.20), (-81.35, 8.95), (-81.20, 8.80), (-80.82, 8.88), (-80.57, 9.07),
+    (-80.30, 9.15), (-80.00, 9.32), (-79.90, 9.37), (-79.65, 9.56), (-79.47, 9.59),
+    (-79.20, 9.58), (-78.97, 9.57), (-78.50, 9.42), (-78.00, 9.18), (-77.75, 8.95),
+    (-77.42, 8.67), (-77.36, 8.68),
+]
+COLOMBIA_BORDER = [
+    (-77.36, 8.68), (-77.46, 8.50), (-77.38, 8.30), (-77.30, 8.17), (-77.35, 7.95),
+    (-77.55, 7.70), (-77.75, 7.45), (-77.89, 7.23),
+]
+PACIFIC_COAST = [
+    (-77.89, 7.23), (-78.17, 7.52), (-78.43, 8.08), (-78.35, 8.35),
+    (-78.55, 8.55), (-78.75, 8.80), (-78.95, 8.93), (-79.35, 9.02), (-79.53, 8.95),
+    (-79.57, 8.90), (-79.65, 8.87), (-79.70, 8.65), (-79.85, 8.58), (-79.95, 8.48),
+    (-80.14, 8.35), (-80.52, 8.22), (-80.45, 8.05), (-80.40, 7.97), (-80.23, 7.75),
+    (-80.02, 7.53), (-80.00, 7.47), (-80.15, 7.35), (-80.45, 7.22), (-80.88, 7.21),
+    (-80.95, 7.55), (-81.05, 7.80), (-81.25, 7.70), (-81.45, 7.45), (-81.70, 7.62),
+    (-81.80, 8.05), (-82.05, 8.20), (-82.43, 8.30), (-82.65, 8.25), (-82.87, 8.03),
+    (-82.90, 8.03),
+]
+COSTA_RICA_BORDER = [
+    (-82.90, 8.03), (-82.93, 8.25), (-82.90, 8.45), (-82.84, 8.53), (-82.83, 8.65),
+    (-82.85, 8.85), (-82.73, 9.05),
+    (-82.80, 9.30), (-82.60, 9.48), (-82.563, 9.566),
+]
+
+PANAMA_MAINLAND = CARIBBEAN_COAST[:-1] + COLOMBIA_BORDER[:-1] + PACIFIC_COAST[:-1] + COSTA_RICA_BORDER[:-1]
+
+# Islas principales
+PANAMA_ISLANDS = [
+    # Coiba
+    [(-81.92, 7.40), (-81.80, 7.64), (-81.65, 7.55), (-81.58, 7.35), (-81.75, 7.20)],
+    # Cébaco
+    [(-81.25, 7.55), (-81.08, 7.55), (-81.12, 7.45), (-81.25, 7.47)],
+    # Isla del Rey (San Miguel)
+    [(-78.97, 8.45), (-78.85, 8.50), (-78.80, 8.28), (-78.90, 8.22)],
+    # Isla San José
+    [(-79.15, 8.30), (-79.05, 8.30), (-79.05, 8.20), (-79.15, 8.20)],
+    # Isla Colón y Bastimentos
+    [(-82.33, 9.42), (-82.22, 9.45), (-82.05, 9.35), (-82.15, 9.30), (-82.27, 9.33)],
+]
+
+# Islas pequeñas lejos de la costa: (lat, lon, radio aproximado en km). Las que
+# están a pocos kilómetros de la costa ya quedan cubiertas por la tolerancia.
+PANAMA_SMALL_ISLANDS = {
+    "Taboga": (8.795, -79.555, 2.0),
+    "Otoque": (8.600, -79.600, 2.0),
+    "Contadora": (8.625, -79.035, 1.5),
+    "Saboga": (8.620, -79.060, 1.5),
+    "Pedro González": (8.410, -79.100, 2.5),
+    "Parida": (8.120, -82.330, 3.0),
+    "Islas Secas": (7.960, -82.020, 2.0),
+    "Islas Contreras": (7.840, -81.770, 3.0),
+    "Montuosa": (7.470, -82.240, 1.5),
+    "Jicarón": (7.270, -81.790, 3.0),
+    "Isla Iguana": (7.630, -79.995, 1.0),
+    "Escudo de Veraguas": (9.100, -81.560, 2.0),
+}
+
+# Territorio vecino junto a las fronteras terrestres (con su mar cercano). La
+# tolerancia costera no se aplica dentro de estos anillos.
+NEIGHBOUR_RINGS = [
+    # Colombia
+    COLOMBIA_BORDER + [(-77.89, 6.50), (-76.50, 6.50), (-76.50, 9.20), (-77.36, 9.20)],
+    # Costa Rica
+    COSTA_RICA_BORDER + [(-82.563, 10.20), (-84.00, 10.20), (-84.00, 7.50), (-82.90, 7.50)],
+]
+
+# Puntos de referencia (cabecera y zonas representativas) de provincias y comarcas.
+# La provincia de un punto se aproxima con la referencia más cercana; no
+# reemplaza los límites oficiales.
+PROVINCE_SEEDS = {
+    "Bocas del Toro": [(9.34, -82.24), (9.43, -82.52), (9.05, -82.20)],
+    "Chiriquí": [(8.43, -82.43), (8.80, -82.60), (8.30, -82.00)],
+    "Ngäbe-Buglé": [(8.50, -81.75), (8.75, -81.60), (8.90, -81.30)],
+    "Veraguas": [(8.10, -80.98), (7.70, -81.20), (8.50, -81.00)],
+    "Coclé": [(8.52, -80.36), (8.65, -80.60)],
+    "Herrera": [(7.96, -80.43), (7.85, -80.75)],
+    "Los Santos": [(7.77, -80.27), (7.45, -80.40)],
+    "Panamá Oeste": [(8.88, -79.78), (8.60, -80.00)],
+    "Panamá": [(8.98, -79.52), (9.10, -79.10), (9.00, -78.60)],
+    "Colón": [(9.36, -79.90), (9.15, -80.25), (9.50, -79.50)],
+    "Guna Yala": [(9.40, -78.90), (9.10, -78.20)],
+    "Darién": [(8.40, -78.14), (8.15, -77.69), (7.70, -78.00)],
+}
+
+# Códigos de resultado de la validación
+VALID = 0
+NOT_FINITE = 1
+OUT_OF_BOUNDS = 2
+OUTSIDE_PANAMA = 3
+
+# Clases de celda de la grilla
+_INVALID = 0
+_VALID = 1
+_BORDER = 2
+
+KM_PER_DEGREE = 111.32
+
+
+class PanamaValidator:
+    """Valida coordenadas contra el contorno de Panamá usando una grilla precalculada.
+
+    Un punto es válido si está dentro del territorio o a menos de
+    `coastal_tolerance_km` de la costa (continente, islas e islas pequeñas). La
+    tolerancia solo se mide desde la costa, nunca desde las fronteras con Costa
+    Rica y Colombia, y no se aplica dentro del territorio vecino. Cada celda de
+    la grilla se clasifica una sola vez como válida, inválida o borde; solo los
+    puntos que caen en celdas de borde requieren la prueba exacta.
+    """
+
+    def __init__(self, cell_deg=0.02, coastal_tolerance_km=5.0):
+        self.cell_deg = cell_deg
+        self.coastal_tolerance_km = coastal_tolerance_km
+        self.rings = [np.array(ring, dtype=np.float64) for ring in [PANAMA_MAINLAND] + PANAMA_ISLANDS]
+        self.neighbour_rings = [np.array(ring, dtype=np.float64) for ring in NEIGHBOUR_RINGS]
+        self.small_islands = np.array(list(PANAMA_SMALL_ISLANDS.values()), dtype=np.float64)
+
+        # Líneas de costa (abiertas) y fronteras terrestres; juntas forman el contorno completo
+        self.sea_lines = [np.array(line, dtype=np.float64) for line in (CARIBBEAN_COAST, PACIFIC_COAST)]
+        self.sea_lines += [np.vstack([ring, ring[:1]]) for ring in self.rings[1:]]
+        self.land_lines = [np.array(line, dtype=np.float64) for line in (COLOMBIA_BORDER, COSTA_RICA_BORDER)]
+        self.neighbour_lines = [np.vstack([ring, ring[:1]]) for ring in self.neighbour_rings]
+
+        # Límites de la grilla con un margen mayor que la tolerancia costera
+        margin = coastal_tolerance_km / KM_PER_DEGREE + cell_deg
+        island_extent = self.small_islands[:, 2:3] / KM_PER_DEGREE
+        all_points = np.concatenate(self.rings + [
+            self.small_islands[:, [1, 0]] - island_extent,
+            self.small_islands[:, [1, 0]] + island_extent,
+        ])
+        self.min_lon, self.min_lat = all_points.min(axis=0) - margin
+        self.max_lon, self.max_lat = all_points.max(axis=0) + margin
+        self.n_cols = int(np.ceil((self.max_lon - self.min_lon) / cell_deg))
+        self.n_rows = int(np.ceil((self.max_lat - self.min_lat) / cell_deg))
+
+        self.grid = self._build_grid()
+
+        names = list(PROVINCE_SEEDS)
+        self.province_names = np.array(names + [""], dtype=object)
+        self.seed_province = np.array([i for i, name in enumerate(names) for _ in PROVINCE_SEEDS[name]])
+        self.seeds = np.array([seed for name in names for seed in PROVINCE_SEEDS[name]])
+
+    # Construcción de la grilla
+    def _build_grid(self):
+        """Clasifica cada celda como válida, inválida o borde.
+
+        Las distancias del centro de la celda al contorno de Panamá, a la costa y
+        al territorio vecino cambian a lo sumo media diagonal dentro de la celda,
+        así que la celda completa queda resuelta si el centro está lejos de los
+        umbrales; en otro caso se marca como borde.
+        """
+        rows, cols = np.mgrid[0:self.n_rows, 0:self.n_cols]
+        lat = self.min_lat + (rows.ravel() + 0.5) * self.cell_deg
+        lon = self.min_lon + (cols.ravel() + 0.5) * self.cell_deg
+        half_diagonal = self.cell_deg * KM_PER_DEGREE * np.sqrt(2) / 2
+        tolerance = self.coastal_tolerance_km
+
+        inside = self._inside(lat, lon, self.rings)
+        to_outline = np.minimum(self._distance_to_lines_km(lat, lon, self.sea_lines),
+                                self._distance_to_lines_km(lat, lon, self.land_lines))
+        to_sea = self._distance_to_sea_km(lat, lon)
+        in_neighbour = self._inside(lat, lon, self.neighbour_rings)
+        to_neighbour = self._distance_to_lines_km(lat, lon, self.neighbour_lines)
+
+        cell_inside = inside & (to_outline > half_diagonal)
+        cell_outside = ~inside & (to_outline > half_diagonal)
+        cell_clear_of_neighbour = ~in_neighbour & (to_neighbour > half_diagonal)
+        cell_in_neighbour = in_neighbour & (to_neighbour > half_diagonal)
+
+        grid = np.full(lat.shape, _BORDER, dtype=np.uint8)
+        grid[cell_inside | (cell_clear_of_neighbour & (to_sea + half_diagonal <= tolerance))] = _VALID
+        grid[cell_outside & (cell_in_neighbour | (to_sea - half_diagonal > tolerance))] = _INVALID
+        return grid.reshape(self.n_rows, self.n_cols)
+
+    def _cell_index(self, lat, lon):
+        row = np.clip(((lat - self.min_lat) / self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+        col = np.clip(((lon - self.min_lon) / self.cell_deg).astype(np.int64), 0, self.n_cols - 1)
+        return row, col
+
+    # Pruebas exactas (solo para las celdas de borde)
+    def _inside(self, lat, lon, rings):
+        """Prueba par-impar contra los anillos indicados."""
+        inside = np.zeros(lat.shape, dtype=bool)
+        for ring in rings:
+            lon1, lat1 = ring[:, 0], ring[:, 1]
+            lon2, lat2 = np.roll(lon1, -1), np.roll(lat1, -1)
+            for x1, y1, x2, y2 in zip(lon1, lat1, lon2, lat2):
+                crosses = (y1 > lat) != (y2 > lat)
+                if not crosses.any():
+                    continue
+                x_cross = x1 + (lat - y1) * (x2 - x1) / (y2 - y1 if y2 != y1 else 1e-12)
+                inside ^= crosses & (lon < x_cross)
+        return inside
+
+    def _distance_to_lines_km(self, lat, lon, lines):
+        """Distancia mínima aproximada (km) de cada punto a los segmentos de las líneas."""
+        scale = np.cos(np.radians(lat))
+        best = np.full(lat.shape, np.inf)
+        for line in lines:
+            for (x1, y1), (x2, y2) in zip(line[:-1], line[1:]):
+                dx, dy = (x2 - x1) * scale, y2 - y1
+                px, py = (lon - x1) * scale, lat - y1
+                length = dx * dx + dy * dy
+                t = np.clip((px * dx + py * dy) / length, 0, 1) if np.any(length) else 0
+                best = np.minimum(best, np.hypot(px - t * dx, py - t * dy))
+        return best * KM_PER_DEGREE
+
+    def _distance_to_sea_km(self, lat, lon):
+        """Distancia (km) a la costa más cercana, incluidas las islas pequeñas."""
+        best = self._distance_to_lines_km(lat, lon, self.sea_lines)
+        scale = np.cos(np.radians(lat))
+        for island_lat, island_lon, radius_km in self.small_islands:
+            d = np.hypot((lon - island_lon) * scale, lat - island_lat) * KM_PER_DEGREE - radius_km
+            best = np.minimum(best, np.maximum(d, 0.0))
+        return best
+
+    def _exact_valid(self, lat, lon):
+        """Prueba exacta de un conjunto de puntos, sin usar la grilla."""
+        ok = self._inside(lat, lon, self.rings)
+        outside = ~ok
+        if self.coastal_tolerance_km and outside.any():
+            o_lat, o_lon = lat[outside], lon[outside]
+            ok[outside] = (self._distance_to_sea_km(o_lat, o_lon) <= self.coastal_tolerance_km) & \
+                ~self._inside(o_lat, o_lon, self.neighbour_rings)
+        return ok
+
+    # API pública
+    def validate(self, lat, lon):
+        """Valida arreglos de coordenadas y regresa (válidos, códigos) por punto."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        codes = np.full(lat.shape, OUTSIDE_PANAMA, dtype=np.uint8)
+
+        finite = np.isfinite(lat) & np.isfinite(lon)
+        codes[~finite] = NOT_FINITE
+
+        in_bounds = finite & (lat >= self.min_lat) & (lat < self.max_lat) & \
+            (lon >= self.min_lon) & (lon < self.max_lon)
+        codes[finite & ~in_bounds] = OUT_OF_BOUNDS
+
+        # La mayoría de los puntos se resuelven con la grilla
+        idx = np.flatnonzero(in_bounds)
+        rows, cols = self._cell_index(lat[idx], lon[idx])
+        cell_class = self.grid[rows, cols]
+        codes[idx[cell_class == _VALID]] = VALID
+
+        # Solo los puntos en celdas de borde se prueban contra el polígono
+        border_idx = idx[cell_class == _BORDER]
+        if border_idx.size:
+            ok = self._exact_valid(lat[border_idx], lon[border_idx])
+            codes[border_idx[ok]] = VALID
+
+        return codes == VALID, codes
+
+    def contains(self, lat, lon):
+        """Regresa un arreglo booleano con los puntos que están en Panamá."""
+        return self.validate(lat, lon)[0]
+
+    def province(self, lat, lon):
+        """Provincia o comarca aproximada de cada punto ("" si está fuera de Panamá)."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        valid, _ = self.validate(lat, lon)
+
+        scale = np.cos(np.radians(lat))[..., None]
+        d_lat = lat[..., None] - self.seeds[:, 0]
+        d_lon = (lon[..., None] - self.seeds[:, 1]) * scale
+        nearest = self.seed_province[np.argmin(d_lat * d_lat + d_lon * d_lon, axis=-1)]
+        nearest = np.where(valid, nearest, len(self.province_names) - 1)
+        return self.province_names[nearest]
+
+    def validate_point(self, lat, lon):
+        """Valida un solo punto y regresa (es_válido, mensaje de error)."""
+        _, codes = self.validate(np.array([lat]), np.array([lon]))
+        code = codes[0]
+        if code == VALID:
+            return True, None
+        if code == NOT_FINITE:
+            return False, "Las coordenadas deben ser números válidos."
+        if code == OUT_OF_BOUNDS:
+            return False, (f"Coordenadas fuera del área de Panamá "
+                           f"({self.min_lat:.1f}° - {self.max_lat:.1f}° N, "
+                           f"{-self.max_lon:.1f}° - {-self.min_lon:.1f}° W). "
+                           f"Valor ingresado: {lat}°, {lon}°")
+        return False, f"Las coordenadas ({lat}°, {lon}°) no están dentro del territorio de Panamá."
+
+
+_validator = None
+
+
+def get_validator():
+    """Regresa el validador compartido, construyendo la grilla la primera vez."""
+    global _validator
+    if _validator is None:
+        _validator = PanamaValidator()
+    return _validator
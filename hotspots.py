@@ -0,0 +1,312 @@
+import math
+import sqlite3
+import threading
+
+import numpy as np
+import folium
+
+import core
+from metrics import metrics
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+HOTSPOT_COLORS = ["#D32F2F", "#F57C00", "#7B1FA2", "#1976D2", "#C2185B", "#5D4037"]
+
+
+class _UnionFind:
+    """Conjuntos disjuntos con compresión de caminos y unión por tamaño."""
+
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def add(self):
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+
+    def find(self, i):
+        parent = self.parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+
+class HotspotEngine:
+    """DBSCAN espacio-temporal incremental sobre distancia haversine.
+
+    Dos avistamientos son vecinos si están a menos de `eps_km` y, si se indica
+    `eps_days`, a menos de `eps_days` días entre sí. Un avistamiento con al menos
+    `min_samples` vecinos (contándose a sí mismo) es núcleo; los núcleos vecinos
+    se unen en la misma zona y los demás puntos cercanos a un núcleo quedan como
+    borde. Los puntos se indexan en una rejilla con celdas del tamaño de `eps`,
+    así cada consulta solo revisa las celdas adyacentes y nunca se construye la
+    matriz completa de distancias. Como solo se agregan puntos, las zonas solo
+    crecen o se fusionan, y la unión de conjuntos las mantiene al día sin
+    recalcular todo el archivo.
+
+    `max_latitude` acota la latitud de los datos para dimensionar las celdas en
+    longitud (10° cubre todo Panamá).
+    """
+
+    def __init__(self, eps_km=1.0, eps_days=None, min_samples=5, max_latitude=10.0):
+        self.eps_km = eps_km
+        self.eps_days = eps_days
+        self.min_samples = min_samples
+
+        self.cell_lat = eps_km / KM_PER_DEGREE
+        self.cell_lon = self.cell_lat / math.cos(math.radians(max_latitude))
+        self.cell_days = eps_days or 0
+
+        self._lock = threading.Lock()
+        self._grid = {}
+        self._uf = _UnionFind()
+        self._capacity = 0
+        self._count = 0
+        self._lat = np.empty(0)
+        self._lon = np.empty(0)
+        self._days = np.empty(0)
+        self._neighbors = np.empty(0, dtype=np.int64)
+        self._core = np.empty(0, dtype=bool)
+        # Núcleo al que se adjunta cada punto de borde (-1 si es ruido)
+        self._attach = np.empty(0, dtype=np.int64)
+
+        self.ids = []
+        self.weights = []
+        self.last_id = 0
+        # Avance de la última carga (agregados, total) para mostrarlo mientras se calcula
+        self.progress = (0, 0)
+
+    def __len__(self):
+        return self._count
+
+    # Índice
+    def _cell(self, lat, lon, days):
+        time_cell = math.floor(days / self.cell_days) if self.cell_days else 0
+        return (math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon), time_cell)
+
+    def _grow(self):
+        capacity = max(1024, self._capacity * 2)
+        for name, fill in (("_lat", 0.0), ("_lon", 0.0), ("_days", 0.0),
+                           ("_neighbors", 0), ("_core", False), ("_attach", -1)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, name, new)
+        self._capacity = capacity
+
+    def _query(self, i):
+        """Índices de los vecinos del punto `i` (sin incluirlo)."""
+        lat, lon, days = self._lat[i], self._lon[i], self._days[i]
+        ci, cj, ck = self._cell(lat, lon, days)
+        time_range = (-1, 0, 1) if self.cell_days else (0,)
+
+        candidates = []
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for dk in time_range:
+                    cell = self._grid.get((ci + di, cj + dj, ck + dk))
+                    if cell:
+                        candidates.extend(cell)
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        candidates = candidates[candidates != i]
+        near = haversine_km(lat, lon, self._lat[candidates], self._lon[candidates]) <= self.eps_km
+        if self.eps_days:
+            near &= np.abs(self._days[candidates] - days) <= self.eps_days
+        return candidates[near]
+
+    # Agrupamiento
+    def add(self, lat, lon, days=0.0, sighting_id=None, weight=1):
+        """Agrega un avistamiento y actualiza las zonas afectadas."""
+        with self._lock:
+            self._add(lat, lon, days, sighting_id, weight)
+
+    def add_many(self, rows):
+        """Agrega varias filas (id, lat, lon, días, peso)."""
+        self.progress = (0, len(rows))
+        with self._lock, metrics.stage("hotspots_update"):
+            for n, (sighting_id, lat, lon, days, weight) in enumerate(rows, 1):
+                self._add(lat, lon, days, sighting_id, weight)
+                if n % 1024 == 0:
+                    self.progress = (n, len(rows))
+        self.progress = (len(rows), len(rows))
+
+    def _add(self, lat, lon, days, sighting_id, weight):
+        if self._count == self._capacity:
+            self._grow()
+        i = self._count
+        self._count += 1
+        self._lat[i], self._lon[i], self._days[i] = lat, lon, days or 0.0
+        self._grid.setdefault(self._cell(lat, lon, self._days[i]), []).append(i)
+        self._uf.add()
+        self.ids.append(sighting_id)
+        self.weights.append(weight or 1)
+        if sighting_id is not None:
+            self.last_id = max(self.last_id, sighting_id)
+
+        neighbors = self._query(i)
+        self._neighbors[neighbors] += 1
+        self._neighbors[i] = len(neighbors) + 1
+
+        # Puntos que se vuelven núcleo con esta inserción (incluido el nuevo)
+        promoted = [int(j) for j in neighbors if self._neighbors[j] == self.min_samples]
+        if self._neighbors[i] >= self.min_samples:
+            promoted.append(i)
+        self._core[promoted] = True
+
+        for c in promoted:
+            around = neighbors if c == i else self._query(c)
+            for j in around[self._core[around]]:
+                self._uf.union(c, int(j))
+            # Los vecinos que no son núcleo quedan como borde de esta zona
+            border = around[~self._core[around] & (self._attach[around] < 0)]
+            self._attach[border] = c
+
+        if not self._core[i] and self._attach[i] < 0:
+            core_neighbors = neighbors[self._core[neighbors]]
+            if len(core_neighbors):
+                self._attach[i] = core_neighbors[0]
+
+    def labels(self):
+        """Etiqueta de zona por punto (la raíz de su conjunto) o -1 para ruido."""
+        with self._lock:
+            labels = np.full(self._count, -1, dtype=np.int64)
+            for i in range(self._count):
+                if self._core[i]:
+                    labels[i] = self._uf.find(i)
+                elif self._attach[i] >= 0:
+                    labels[i] = self._uf.find(int(self._attach[i]))
+            return labels
+
+    def clusters(self):
+        """Agrupa los índices de los puntos por zona."""
+        groups = {}
+        for i, label in enumerate(self.labels()):
+            if label >= 0:
+                groups.setdefault(int(label), []).append(i)
+        return list(groups.values())
+
+    # Base de datos
+    def update_from_db(self, db_path):
+        """Agrega solo los avistamientos con id mayor al último procesado."""
+        conn = sqlite3.connect(db_path)
+        with metrics.stage("db_query"):
+            rows = conn.execute("""
+                SELECT id, latitude, longitude, julianday(timestamp), detections_count
+                FROM sightings
+                WHERE id > ?
+                ORDER BY id
+            """, (self.last_id,)).fetchall()
+        conn.close()
+
+        if self.eps_days:
+            # Sin fecha no se puede ubicar en el tiempo
+            last_id = max((row[0] for row in rows), default=self.last_id)
+            rows = [row for row in rows if row[3] is not None]
+            self.add_many(rows)
+            self.last_id = max(self.last_id, last_id)
+        else:
+            self.add_many(rows)
+        return len(rows)
+
+    def hotspots(self, min_size=None):
+        """Resumen de cada zona: puntos, polígono y totales, de la más grande a la más pequeña."""
+        min_size = min_size or self.min_samples
+        result = []
+        for members in self.clusters():
+            if len(members) < min_size:
+                continue
+            members = np.asarray(members)
+            lat, lon, days = self._lat[members], self._lon[members], self._days[members]
+            result.append({
+                'size': len(members),
+                'iguanas': int(sum(self.weights[m] for m in members)),
+                'center': (float(lat.mean()), float(lon.mean())),
+                'hull': convex_hull(np.column_stack([lat, lon])),
+                'first_day': float(days.min()),
+                'last_day': float(days.max()),
+            })
+        result.sort(key=lambda h: h['size'], reverse=True)
+        return result
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia haversine en kilómetros (acepta escalares o arreglos)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def convex_hull(points):
+    """Envolvente convexa (cadena monótona) de puntos [lat, lon], en orden antihorario."""
+    points = sorted(set(map(tuple, np.round(points, 7).tolist())))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
+def _format_day(julian_day):
+    # Día juliano -> fecha (el 1970-01-01 es el día juliano 2440587.5)
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp((julian_day - 2440587.5) * 86400, tz=timezone.utc).strftime('%d/%m/%Y')
+
+
+def build_hotspots_map(hotspots, eps_km):
+    """Crea el mapa con un polígono por zona crítica."""
+    m = core.create_interactive_map(core.PANAMA_CENTER, zoom_start=8)
+
+    for n, hotspot in enumerate(hotspots):
+        color = HOTSPOT_COLORS[n % len(HOTSPOT_COLORS)]
+        popup_html = f"""
+        <div style='width: 220px;'>
+            <h4 style='margin: 5px 0; color: {color};'>🔥 Zona crítica #{n+1}</h4>
+            <hr style='margin: 5px 0;'>
+            <div>🏷️ <b>Avistamientos:</b> {hotspot['size']}</div>
+            <div>🦎 <b>Iguanas:</b> {hotspot['iguanas']}</div>
+        """
+        if hotspot['first_day']:
+            popup_html += (f"<div>📅 <b>Periodo:</b> {_format_day(hotspot['first_day'])}"
+                           f" - {_format_day(hotspot['last_day'])}</div>")
+        popup_html += "</div>"
+        tooltip = f"Zona #{n+1}: {hotspot['size']} avistamientos"
+
+        hull = hotspot['hull']
+        if len(hull) >= 3:
+            folium.Polygon(hull, color=color, weight=2, fill=True, fill_opacity=0.35,
+                           popup=folium.Popup(popup_html, max_width=260), tooltip=tooltip).add_to(m)
+        else:
+            # Puntos repetidos o alineados: se marca el área con un círculo del radio de búsqueda
+            folium.Circle(hotspot['center'], radius=eps_km * 1000, color=color, fill=True,
+                          fill_opacity=0.35, popup=folium.Popup(popup_html, max_width=260),
+                          tooltip=tooltip).add_to(m)
+
+    return m
@@ -4,18 +4,20 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk, ImageDraw
 import folium
-from folium import plugins
 import webbrowser
 import tempfile
 import numpy as np
-from datetime import datetime
 import json
-import sqlite3
-import shutil
-from ultralytics import YOLO
 import cv2
-import uuid
 import re
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+import core
+from storage import StorageManager
+import geo
+from prefilter import PrefilterCascade
+from hotspots import HotspotEngine, build_hotspots_map
 
 class IguanaSightingsApp:
     def __init__(self, root):
@@ -45,32 +47,112 @@ class IguanaSightingsApp:
         self.current_image_path = None
         self.location_coords = None
         self.detection_result = None
-        self.db_path = "iguana_sightings.db"
+        # Junto a la carpeta de imágenes: el mantenimiento decide qué imágenes son huérfanas con esta base
+        self.db_path = os.path.join(self.base_dir, "iguana_sightings.db")
         self.saved_image_path = None
         
+        # Tamaño de celda (en grados) para agrupar avistamientos en la línea de tiempo
+        self.timeline_cell_deg = 0.01
+        
+        # Prefiltro opcional que descarta cuadros vacíos antes de YOLO
+        self.prefilter_threshold = 0.004
+        self.prefilter = None
+        
+        # Parámetros del agrupamiento de zonas críticas (radio, ventana de días y mínimo de avistamientos)
+        self.hotspot_eps_km = 1.0
+        self.hotspot_eps_days = 90
+        self.hotspot_min_samples = 5
+        self.hotspots = HotspotEngine(self.hotspot_eps_km, self.hotspot_eps_days, self.hotspot_min_samples)
+        # El agrupamiento corre fuera del hilo de la interfaz
+        self.hotspots_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hotspots")
+        self.hotspots_future = None
+        
+        # Configuración del almacenamiento de imágenes guardadas
+        self.storage_quota_mb = 500
+        self.recompress_after_days = 30
+        self.recompress_format = "JPEG"
+        self.recompress_quality = 85
+        
         # Inicializacion base de datos
         self.init_database()
         
+        # Índice de las imágenes guardadas. El mantenimiento en segundo plano
+        # recomprime con pérdida y elimina originales, así que solo se activa si el
+        # usuario lo confirmó desde el menú de almacenamiento.
+        self.storage = StorageManager(
+            self.db_path, self.saved_images_dir,
+            quota_mb=self.storage_quota_mb,
+            recompress_after_days=self.recompress_after_days,
+            recompress_format=self.recompress_format,
+            quality=self.recompress_quality
+        )
+        if self.storage.get_setting("auto_maintenance") == "1":
+            self.storage.start_background()
+        
         # Carga del modelo YOLOv8
         self.load_yolo_model()
         
         # Creación del interfaz
+        self.create_menu()
         self.create_widgets()
     
     #Carga del modelo YOLOv8
     def load_yolo_model(self):
         """Carga el modelo YOLO con manejo de errores."""
         try:
-            if not os.path.exists(self.model_path):
-                raise FileNotFoundError(f"Modelo no encontrado en: {self.model_path}")
-            
-            self.model = YOLO(self.model_path)
+            self.model = core.load_model(self.model_path)
             print("Modelo YOLO cargado correctamente.")
         except Exception as e:
             error_msg = f"No se pudo cargar el modelo YOLO: {str(e)}\n\nVerifica que el archivo 'best.pt' esté en la carpeta 'yolo_model'"
             messagebox.showerror("Error Crítico", error_msg)
             sys.exit(1)
     
+    def create_menu(self):
+        """Crea la barra de menú con las opciones de diagnóstico."""
+        menu_bar = tk.Menu(self.root)
+        
+        # Menú de diagnóstico para métricas y perfilado
+        diagnostics_menu = tk.Menu(menu_bar, tearoff=0)
+        self.metrics_enabled = tk.BooleanVar(value=metrics.enabled)
+        diagnostics_menu.add_checkbutton(label="Registrar métricas",
+                                         variable=self.metrics_enabled,
+                                         command=self.toggle_metrics)
+        diagnostics_menu.add_command(label="Ver métricas", command=self.show_metrics)
+        diagnostics_menu.add_command(label="Exportar métricas...", command=self.export_metrics)
+        diagnostics_menu.add_command(label="Reiniciar métricas", command=metrics.reset)
+        diagnostics_menu.add_separator()
+        self.profiling_enabled = tk.BooleanVar(value=metrics.profiling)
+        diagnostics_menu.add_checkbutton(label="Perfilado (cProfile)",
+                                         variable=self.profiling_enabled,
+                                         command=self.toggle_profiling)
+        menu_bar.add_cascade(label="Diagnóstico", menu=diagnostics_menu)
+        
+        # Menú de detección
+        detection_menu = tk.Menu(menu_bar, tearoff=0)
+        self.prefilter_enabled = tk.BooleanVar(value=self.prefilter is not None)
+        detection_menu.add_checkbutton(label="Prefiltro de cuadros vacíos",
+                                       variable=self.prefilter_enabled,
+                                       command=self.toggle_prefilter)
+        detection_menu.add_command(label="Estadísticas del prefiltro", command=self.show_prefilter_stats)
+        menu_bar.add_cascade(label="Detección", menu=detection_menu)
+        
+        # Menú de almacenamiento de imágenes guardadas
+        storage_menu = tk.Menu(menu_bar, tearoff=0)
+        storage_menu.add_command(label="Gestionar imágenes", command=self.manage_saved_images)
+        self.auto_maintenance = tk.BooleanVar(value=self.storage.get_setting("auto_maintenance") == "1")
+        storage_menu.add_checkbutton(label="Mantenimiento automático",
+                                     variable=self.auto_maintenance,
+                                     command=self.toggle_storage_maintenance)
+        storage_menu.add_command(label="Eliminar imágenes sin avistamiento", command=self.prune_saved_images)
+        menu_bar.add_cascade(label="Almacenamiento", menu=storage_menu)
+        
+        # Análisis de los avistamientos
+        analysis_menu = tk.Menu(menu_bar, tearoff=0)
+        analysis_menu.add_command(label="Zonas críticas", command=self.show_hotspots)
+        menu_bar.add_cascade(label="Análisis", menu=analysis_menu)
+        
+        self.root.config(menu=menu_bar)
+    
     def create_widgets(self):
         """Crea los widgets de la interfaz de usuario."""
         # Panel superior para imágenes y controles
@@ -181,6 +263,26 @@ class IguanaSightingsApp:
                                    command=self.explore_interactive_map)
         self.btn_explore_map.grid(row=0, column=3, padx=5)
         
+        # Controles para la línea de tiempo de avistamientos
+        timeline_frame = tk.Frame(bottom_frame, bg="#6CE45E")
+        timeline_frame.pack(pady=5)
+        
+        tk.Label(timeline_frame, text="Paso:",
+                 font=("Arial", 10, "bold"), fg="white",
+                 bg="#292929").grid(row=0, column=0, padx=5)
+        
+        self.timeline_step = tk.StringVar(value="Mes")
+        self.timeline_menu = tk.OptionMenu(timeline_frame, self.timeline_step, *core.TIMELINE_STEPS.keys())
+        self.timeline_menu.config(font=("Arial", 10, "bold"), fg="white", bg="#292929")
+        self.timeline_menu.grid(row=0, column=1, padx=5)
+        
+        # Botón para mostrar la evolución temporal de los avistamientos
+        self.btn_timeline = tk.Button(timeline_frame, text="Línea de tiempo",
+                                      font=("Arial", 10, "bold"), fg="white",
+                                      bg="#292929",
+                                      command=self.show_sightings_timeline)
+        self.btn_timeline.grid(row=0, column=2, padx=5)
+        
     def explore_interactive_map(self):
         """Abre un mapa interactivo para explorar y obtener coordenadas sin necesidad de avistamientos."""
         try:
@@ -240,25 +342,7 @@ class IguanaSightingsApp:
         
     def init_database(self):
         """Inicializa la base de datos y crea la tabla si no existe."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Se crea una tabla para los avistamientos en la base de datos (sino existe)
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sightings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            latitude REAL NOT NULL, 
-            longitude REAL NOT NULL,
-            original_image_path TEXT NOT NULL,
-            saved_image_path TEXT NOT NULL,
-            detection_confidence REAL,
-            detections_count INTEGER,
-            timestamp TEXT
-        )
-        ''')    
-        
-        conn.commit()
-        conn.close()
+        core.init_database(self.db_path)
         
     def validate_coordinates(self, lat_str, lon_str):
         """Validacion de las coordenadas sean válidas para Panamá."""
@@ -277,15 +361,8 @@ class IguanaSightingsApp:
             lat = float(lat_str)
             lon = float(lon_str)
             
-            # Validación de rangos para Panamá
-            # Panamá está entre 7°-10° N y 77°-83° W
-            if not (7.0 <= lat <= 10.0):
-                return False, f"Latitud fuera del rango de Panamá (7° - 10° N). Valor ingresado: {lat}°"
-            
-            if not (-83.0 <= lon <= -77.0):
-                return False, f"Longitud fuera del rango de Panamá (77° - 83° W). Valor ingresado: {lon}°"
-            
-            return True, None
+            # Validación contra el contorno de Panamá (mismo motor que la validación masiva)
+            return geo.get_validator().validate_point(lat, lon)
             
         except ValueError:
             return False, "Las coordenadas deben ser números válidos."
@@ -329,52 +406,32 @@ class IguanaSightingsApp:
         
         try:
             # Carga la imagen
-            image = cv2.imread(self.current_image_path)
+            with metrics.stage("decode"):
+                image = cv2.imread(self.current_image_path)
             if image is None:
                 messagebox.showerror("Error", "No se pudo cargar la imagen.")
                 return
             
-            # Predicción de YOLOv8
-            results = self.model(image)
-            
-            # Procesar resultados
-            detections = []
-            max_confidence = 0.0
-            total_detections = 0
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        confidence = float(box.conf[0])
-                        class_id = int(box.cls[0])
-                        
-                        detections.append({
-                            'confidence': confidence,
-                            'class_id': class_id,
-                            'bbox': box.xyxy[0].tolist()
-                        })
-                        
-                        if confidence > max_confidence:
-                            max_confidence = confidence
-                        total_detections += 1
+            # Predicción de YOLOv8 y procesamiento de resultados
+            # Las imágenes de una misma carpeta se tratan como la misma cámara para el prefiltro
+            detection_result = core.run_detection(
+                self.model, image,
+                prefilter=self.prefilter,
+                source=os.path.dirname(self.current_image_path)
+            )
+            detections = detection_result['all_detections']
+            total_detections = detection_result['detections_count']
             
             # Mostrar resultados
-            if detections:
-                best_detection = max(detections, key=lambda x: x['confidence'])
-                confidence_percentage = best_detection['confidence'] * 100
+            if detection_result['is_iguana']:
+                confidence_percentage = detection_result['confidence'] * 100
                 
                 result_text = f"Resultado: Iguana detectada con {confidence_percentage:.1f}% de confianza."
                 if total_detections > 1:
                     result_text += f" Total de detecciones: {total_detections}."
                     
                 self.result_label.config(text=result_text, fg="green")
-                self.detection_result = {
-                    'is_iguana': True,
-                    'confidence': best_detection['confidence'],
-                    'detections_count': total_detections,
-                    'all_detections': detections
-                }
+                self.detection_result = detection_result
                 
                 # Habilitar botones después de detección exitosa
                 self.btn_update_map.config(state=tk.NORMAL)
@@ -382,16 +439,14 @@ class IguanaSightingsApp:
                 # El botón de guardar se habilitará después de ingresar coordenadas válidas
                 
                 # Mostrar imagen con bounding boxes
-                self.display_image_with_detections(image, detections)
+                with metrics.stage("draw"):
+                    self.display_image_with_detections(image, detections)
             else:
                 result_text = "Resultado: No se detectaron iguanas."
+                if detection_result.get('prefiltered'):
+                    result_text += " (Cuadro vacío descartado por el prefiltro)"
                 self.result_label.config(text=result_text, fg="red")
-                self.detection_result = {
-                    'is_iguana': False,
-                    'confidence': 0.0,
-                    'detections_count': 0,
-                    'all_detections': []
-                }
+                self.detection_result = detection_result
                 # No se habilitan botones si no hay detección
                 self.btn_update_map.config(state=tk.DISABLED)
                 self.btn_save_sighting.config(state=tk.DISABLED)
@@ -443,17 +498,11 @@ class IguanaSightingsApp:
             if not self.current_image_path:
                 return None
             
-            # Generar nombre único para la imagen
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4())[:8]
-            file_extension = os.path.splitext(self.current_image_path)[1]
-            new_filename = f"iguana_{timestamp}_{unique_id}{file_extension}"
+            # Generar ruta única para la imagen
+            saved_path = core.new_saved_image_path(self.saved_images_dir, self.current_image_path)
             
-            # Ruta completa para guardar
-            saved_path = os.path.join(self.saved_images_dir, new_filename)
-            
-            # Copiar la imagen
-            shutil.copy2(self.current_image_path, saved_path)
+            # Copiar la imagen y registrarla en el índice de almacenamiento
+            self.storage.add_copy(self.current_image_path, saved_path)
             
             return saved_path
             
@@ -519,7 +568,7 @@ class IguanaSightingsApp:
             
             # Guardar el mapa temporalmente
             temp_map = tempfile.NamedTemporaryFile(delete=False, suffix=".html")
-            m.save(temp_map.name)
+            core.render_map(m, temp_map.name)
             
             # Abrir el mapa en el navegador
             webbrowser.open('file://' + temp_map.name, new=2)
@@ -529,41 +578,7 @@ class IguanaSightingsApp:
     
     def create_interactive_map(self, center_location, zoom_start=10):
         """Crea un mapa interactivo con funcionalidades adicionales incluyendo popup de coordenadas."""
-        # Crear el mapa base
-        m = folium.Map(location=center_location, zoom_start=zoom_start)
-        
-        # JavaScript para capturar clicks
-        click_script = """
-        <script>
-        function onMapClick(e) {
-            var lat = e.latlng.lat.toFixed(6);
-            var lng = e.latlng.lng.toFixed(6);
-            
-            // Crear popup con las coordenadas
-            var popup = L.popup()
-                .setLatLng(e.latlng)
-                .setContent('<b>Coordenadas:</b><br>Latitud: ' + lat + '<br>Longitud: ' + lng)
-                .openOn(this);
-            
-            console.log('Latitud: ' + lat + ', Longitud: ' + lng);
-        }
-        
-        // Esperar a que el mapa se cargue
-        document.addEventListener('DOMContentLoaded', function() {
-            setTimeout(function() {
-                var mapId = Object.keys(window).find(key => key.startsWith('map_'));
-                if (mapId && window[mapId]) {
-                    window[mapId].on('click', onMapClick);
-                }
-            }, 100);
-        });
-        </script>
-        """
-    
-        # Agregar el script al mapa
-        m.get_root().html.add_child(folium.Element(click_script))
-        
-        return m
+        return core.create_interactive_map(center_location, zoom_start=zoom_start)
     
     def save_sighting(self):
         """Versión modificada que incluye limpieza de imágenes."""
@@ -590,23 +605,12 @@ class IguanaSightingsApp:
                 messagebox.showerror("Error", "No se pudo guardar la imagen del avistamiento.")
                 return
             
-            # Conectar a la base de datos y guardar
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            INSERT INTO sightings (latitude, longitude, original_image_path, saved_image_path, 
-                                detection_confidence, detections_count, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                lat, lon, self.current_image_path, saved_image_path,
+            # Guardar en la base de datos
+            core.insert_sighting(
+                self.db_path, lat, lon, self.current_image_path, saved_image_path,
                 self.detection_result['confidence'],
-                self.detection_result['detections_count'],
-                datetime.now().isoformat()
-            ))
-            
-            conn.commit()
-            conn.close()
+                self.detection_result['detections_count']
+            )
             
             # Pregunta para eliminar imagen original
             if self.ask_delete_original_image():
@@ -621,6 +625,8 @@ class IguanaSightingsApp:
             # Limpiaeza de formulario
             self.reset_form()
             
+            self.warn_if_over_quota()
+            
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo guardar el avistamiento: {str(e)}")
             print(f"Error al guardar el avistamiento: {str(e)}")
@@ -653,125 +659,107 @@ class IguanaSightingsApp:
     def show_all_sightings(self):
         """Muestra todos los avistamientos guardados en el mapa."""
         try:
-            # Conectar a la base de datos
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Obtener todos los avistamientos
-            cursor.execute("""
-                SELECT latitude, longitude, timestamp, detection_confidence, 
-                       detections_count, saved_image_path 
-                FROM sightings 
-                ORDER BY timestamp DESC
-            """)
-            sightings = cursor.fetchall()
-            
-            conn.close()
+            sightings = core.fetch_sightings(self.db_path)
             
             if not sightings:
                 messagebox.showinfo("Información", "No hay avistamientos guardados todavía.")
                 return
             
-            # Crear un mapa interactivo centrado en Panamá
-            m = self.create_interactive_map([8.9943, -79.5188], zoom_start=8)
-            
-            # Añadir marcadores para todos los avistamientos
-            for i, (lat, lon, timestamp, confidence, count, image_path) in enumerate(sightings):
-                # Formatear fecha
-                try:
-                    dt = datetime.fromisoformat(timestamp.replace('T', ' '))
-                    formatted_date = dt.strftime("%d/%m/%Y %H:%M")
-                except:
-                    formatted_date = timestamp.split('T')[0]
-                
-                # Crear contenido del popup
-                popup_html = f"""
-                <div style='width: 280px; text-align: center;'>
-                    <h4 style='margin: 5px 0; color: #2E7D32;'>🦎 Avistamiento #{i+1}</h4>
-                    <hr style='margin: 5px 0;'>
-                    <table style='width: 100%; font-size: 12px;'>
-                        <tr><td><b>📅Fecha:</b></td><td>{formatted_date}</td></tr>
-                        <tr><td><b>📍 Coordenadas:</b></td><td>{lat:.6f}, {lon:.6f}</td></tr>
-                        <tr><td><b>🎯 Confianza:</b></td><td>{confidence*100:.1f}%</td></tr>
-                        <tr><td><b>🔢 Cantidad:</b></td><td>{count}</td></tr>
-                    </table>
-                """
-                
-                # Agregar imagen si existe
-                if image_path and os.path.exists(image_path):
-                    # Convertir ruta a URL file://
-                    file_url = image_path.replace("\\", "/")
-                    popup_html += f"""
-                    <hr style='margin: 10px 0;'>
-                    <img src="file:///{file_url}" 
-                         width="240" height="180" 
-                         style="border-radius: 8px; border: 2px solid #4CAF50;">
-                    """
-                else:
-                    popup_html += "<br><i>🚫 Imagen no disponible</i>"
-                
-                popup_html += "</div>"
-                
-                # Determinar color del marcador basado en confianza
-                if confidence >= 0.8:
-                    marker_color = "green"
-                    icon_name = "leaf"
-                elif confidence >= 0.6:
-                    marker_color = "orange"
-                    icon_name = "exclamation-triangle"
-                else:
-                    marker_color = "red"
-                    icon_name = "question"
-                
-                # Crear popup
-                popup = folium.Popup(popup_html, max_width=300)
-                
-                # Añadir marcador
-                folium.Marker(
-                    location=[lat, lon],
-                    popup=popup,
-                    tooltip=f"Avistamiento {formatted_date} - {confidence*100:.1f}%",
-                    icon=folium.Icon(color=marker_color, icon=icon_name, prefix='fa')
-                ).add_to(m)
-            
-            # Agregar información estadística
-            total_sightings = len(sightings)
-            avg_confidence = sum(s[3] for s in sightings) / total_sightings
-            total_iguanas = sum(s[4] for s in sightings)
-            
-            stats_html = f"""
-            <div style='position: fixed; 
-                        top: 10px; left: 10px; 
-                        background: rgba(255,255,255,0.9); 
-                        padding: 10px; 
-                        border-radius: 8px; 
-                        border: 2px solid #4CAF50;
-                        font-family: Arial;
-                        z-index: 1000;'>
-                <h4 style='margin: 0 0 10px 0; color: #2E7D32;'>📊 Estadísticas</h4>
-                <div style='font-size: 14px;'>
-                    <div>🏷️ <b>Total avistamientos:</b> {total_sightings}</div>
-                    <div>🦎 <b>Total iguanas:</b> {total_iguanas}</div>
-                    <div>📈 <b>Confianza promedio:</b> {avg_confidence*100:.1f}%</div>
-                </div>
-            </div>
-            """
-            
-            m.get_root().html.add_child(folium.Element(stats_html))
+            # Crear un mapa con marcadores y estadísticas
+            m = core.build_sightings_map(sightings)
             
             # Guardar mapa como HTML temporal
             temp_map = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
-            m.save(temp_map.name)
+            core.render_map(m, temp_map.name)
             
             # Abre el mapa en el navegador predeterminado
             webbrowser.open('file://' + temp_map.name, new=2)
             
-            print(f"Mapa generado con {total_sightings} avistamientos")
+            print(f"Mapa generado con {len(sightings)} avistamientos")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error al mostrar avistamientos: {str(e)}")
             print(f"Error detallado: {e}")
 
+    def show_sightings_timeline(self):
+        """Muestra la evolución de los avistamientos en un mapa animado por intervalos."""
+        try:
+            step = self.timeline_step.get()
+            labels, frames = core.fetch_timeline_frames(self.db_path, step, self.timeline_cell_deg)
+            
+            if not frames:
+                messagebox.showinfo("Información", "No hay avistamientos guardados todavía.")
+                return
+            
+            # Capa de calor animada: un cuadro por intervalo de tiempo
+            m = core.build_timeline_map(labels, frames, step)
+            total_cells = sum(len(frame) for frame in frames)
+            
+            # Guardar mapa como HTML temporal
+            temp_map = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
+            core.render_map(m, temp_map.name)
+            
+            # Abre el mapa en el navegador predeterminado
+            webbrowser.open('file://' + temp_map.name, new=2)
+            
+            print(f"Línea de tiempo generada con {len(frames)} intervalos y {total_cells} celdas")
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al mostrar la línea de tiempo: {str(e)}")
+            print(f"Error detallado: {e}")
+
+    def show_hotspots(self):
+        """Calcula en segundo plano las zonas con concentración de avistamientos."""
+        if self.hotspots_future and not self.hotspots_future.done():
+            messagebox.showinfo("Información", "Las zonas críticas todavía se están calculando.")
+            return
+        
+        self.hotspots_title = self.root.title()
+        self.root.config(cursor="watch")
+        self.hotspots_future = self.hotspots_executor.submit(self.compute_hotspots)
+        self.root.after(200, self.check_hotspots)
+    
+    def compute_hotspots(self):
+        """Agrega solo los avistamientos nuevos desde la última consulta y resume las zonas."""
+        added = self.hotspots.update_from_db(self.db_path)
+        return added, self.hotspots.hotspots()
+    
+    def check_hotspots(self):
+        """Muestra el avance del cálculo y abre el mapa cuando termina."""
+        if not self.hotspots_future.done():
+            done, total = self.hotspots.progress
+            if total:
+                self.root.title(f"{self.hotspots_title} - Calculando zonas críticas {done}/{total}")
+            self.root.after(200, self.check_hotspots)
+            return
+        
+        self.root.title(self.hotspots_title)
+        self.root.config(cursor="")
+        try:
+            added, hotspots = self.hotspots_future.result()
+            
+            if not hotspots:
+                messagebox.showinfo("Información",
+                                    f"No hay zonas con al menos {self.hotspot_min_samples} avistamientos "
+                                    f"a menos de {self.hotspot_eps_km} km y {self.hotspot_eps_days} días entre sí.")
+                return
+            
+            m = build_hotspots_map(hotspots, self.hotspot_eps_km)
+            
+            # Guardar mapa como HTML temporal
+            temp_map = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
+            core.render_map(m, temp_map.name)
+            
+            # Abre el mapa en el navegador predeterminado
+            webbrowser.open('file://' + temp_map.name, new=2)
+            
+            print(f"Zonas críticas: {len(hotspots)} ({added} avistamientos nuevos, {len(self.hotspots)} en total)")
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al calcular las zonas críticas: {str(e)}")
+            print(f"Error detallado: {e}")
+
     def ask_delete_original_image(self):
         """Pregunta al usuario si desea eliminar la imagen original después de guardar."""
         try:
@@ -851,38 +839,204 @@ class IguanaSightingsApp:
     def manage_saved_images(self):
         """Función para gestionar imágenes guardadas (opcional)."""
         try:
-            # Obtencion información de archivos guardados
-            saved_files = []
-            if os.path.exists(self.saved_images_dir):
-                for filename in os.listdir(self.saved_images_dir):
-                    filepath = os.path.join(self.saved_images_dir, filename)
-                    if os.path.isfile(filepath):
-                        file_size = os.path.getsize(filepath)
-                        file_time = os.path.getmtime(filepath)
-                        saved_files.append({
-                            'name': filename,
-                            'path': filepath,
-                            'size': file_size,
-                            'modified': datetime.fromtimestamp(file_time)
-                        })
-            
-            total_size = sum(f['size'] for f in saved_files)
-            total_count = len(saved_files)
+            # Sincronizar el índice (solo recorre la carpeta si cambió)
+            self.storage.refresh()
+            total_count, total_size = self.storage.usage()
+            
+            status = self.storage.quota_status()
             
             info_message = f"Gestión de Imágenes Guardadas\n\n"
             info_message += f"Total de archivos: {total_count}\n"
             info_message += f"Espacio ocupado: {total_size / (1024*1024):.2f} MB\n"
+            if status['within_quota']:
+                info_message += f"Cuota: {self.storage_quota_mb} MB\n"
+            else:
+                excess = (status['total_bytes'] - status['quota_bytes']) / (1024*1024)
+                info_message += f"Cuota: {self.storage_quota_mb} MB (excedida por {excess:.2f} MB)\n"
             info_message += f"Ubicación: {self.saved_images_dir}\n\n"
-            info_message += "Las imágenes se eliminan automáticamente\n"
-            info_message += "después de guardar cada avistamiento (opcional)"
+            if self.auto_maintenance.get():
+                info_message += f"Las imágenes con más de {self.recompress_after_days} días\n"
+                info_message += f"se recomprimen automáticamente ({self.recompress_format}, calidad {self.recompress_quality})"
+                summary = self.storage.last_summary
+                if summary:
+                    info_message += f"\n\nÚltimo mantenimiento: {summary['finished'][:16].replace('T', ' ')}"
+                    info_message += f"\nRecomprimidas: {summary['recompressed']}, eliminadas: {summary['pruned']}"
+            else:
+                info_message += "El mantenimiento automático está desactivado\n(menú Almacenamiento)."
             
-            messagebox.showinfo("Gestión de Archivos", info_message)
+            if status['within_quota']:
+                messagebox.showinfo("Gestión de Archivos", info_message)
+            else:
+                messagebox.showwarning("Gestión de Archivos", info_message)
             
         except Exception as e:
             messagebox.showerror("Error", f"Error al gestionar imágenes: {str(e)}")
+    
+    def toggle_storage_maintenance(self):
+        """Activa o desactiva el mantenimiento automático de las imágenes guardadas."""
+        if not self.auto_maintenance.get():
+            self.storage.set_setting("auto_maintenance", "0")
+            self.storage.stop_background()
+            return
+        
+        if not messagebox.askyesno(
+            "Mantenimiento Automático",
+            f"El mantenimiento automático recomprime las imágenes guardadas con más de\n"
+            f"{self.recompress_after_days} días ({self.recompress_format}, calidad {self.recompress_quality}) "
+            "y elimina los originales.\n"
+            f"Si se excede la cuota de {self.storage_quota_mb} MB, también elimina las imágenes\n"
+            "que no pertenecen a ningún avistamiento.\n\n"
+            "La recompresión reduce la calidad de las imágenes. ¿Desea activarlo?",
+            icon='warning'
+        ):
+            self.auto_maintenance.set(False)
+            return
+        
+        self.storage.set_setting("auto_maintenance", "1")
+        self.storage.start_background()
+    
+    def warn_if_over_quota(self):
+        """Avisa si las imágenes guardadas exceden la cuota configurada."""
+        status = self.storage.quota_status()
+        if status['within_quota']:
+            return
+        
+        messagebox.showwarning(
+            "Almacenamiento",
+            f"Las imágenes guardadas ocupan {status['total_bytes'] / (1024*1024):.2f} MB,\n"
+            f"más que la cuota de {self.storage_quota_mb} MB.\n\n"
+            "Puede activar el mantenimiento automático o eliminar imágenes\n"
+            "sin avistamiento desde el menú Almacenamiento."
+        )
+    
+    def prune_saved_images(self):
+        """Elimina las imágenes guardadas que ningún avistamiento referencia."""
+        try:
+            self.storage.refresh()
+            count, size = self.storage.prune_orphans(dry_run=True)
+            if not count:
+                messagebox.showinfo("Gestión de Archivos", "No hay imágenes sin avistamiento.")
+                return
+            
+            if not messagebox.askyesno(
+                "Limpieza de Archivos",
+                f"Hay {count} imágenes ({size / (1024*1024):.2f} MB) que no pertenecen\n"
+                "a ningún avistamiento guardado.\n\n"
+                "¿Desea eliminarlas?",
+                icon='question'
+            ):
+                return
+            
+            count, size = self.storage.prune_orphans()
+            messagebox.showinfo("Gestión de Archivos",
+                                f"Se eliminaron {count} imágenes ({size / (1024*1024):.2f} MB).")
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al limpiar imágenes: {str(e)}")
+
+    # Detección
+    def toggle_prefilter(self):
+        """Activa o desactiva el prefiltro de cuadros vacíos."""
+        if self.prefilter_enabled.get():
+            self.prefilter = PrefilterCascade(threshold=self.prefilter_threshold)
+        else:
+            self.prefilter = None
+    
+    def show_prefilter_stats(self):
+        """Muestra cuántos cuadros descartó el prefiltro y el tiempo ahorrado."""
+        if self.prefilter is None:
+            messagebox.showinfo("Prefiltro", "El prefiltro de cuadros vacíos está desactivado.")
+            return
+        
+        stats = self.prefilter.stats()
+        messagebox.showinfo("Prefiltro",
+                            f"Cuadros analizados: {stats['frames_seen']}\n"
+                            f"Cuadros descartados: {stats['frames_skipped']} ({stats['skip_rate']*100:.1f}%)\n"
+                            f"Tiempo ahorrado (estimado): {stats['time_saved_s']:.1f} s")
+    
+    # Diagnóstico
+    def toggle_metrics(self):
+        """Activa o desactiva el registro de métricas."""
+        metrics.enabled = self.metrics_enabled.get()
+        print(f"Métricas {'activadas' if metrics.enabled else 'desactivadas'}")
+    
+    def show_metrics(self):
+        """Muestra las métricas actuales en una ventana."""
+        try:
+            window = tk.Toplevel(self.root)
+            window.title("Métricas de rendimiento")
+            window.geometry("520x420")
+            window.configure(bg="#292929")
+            
+            text = tk.Text(window, font=("Consolas", 9), bg="#100F0F", fg="white")
+            text.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+            
+            snapshot = metrics.snapshot()
+            lines = [f"Métricas {'activadas' if snapshot['enabled'] else 'desactivadas'}", ""]
+            lines.append(f"{'Etapa':<14}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+            for name, stage in sorted(snapshot['stages'].items()):
+                lines.append(f"{name:<14}{stage['count']:>7}{stage['p50_ms']:>10.1f}"
+                             f"{stage['p95_ms']:>10.1f}{stage['p99_ms']:>10.1f}")
+            lines.append("")
+            for name, value in sorted(snapshot['counters'].items()):
+                lines.append(f"{name}: {value}")
+            
+            text.insert(tk.END, "\n".join(lines))
+            text.config(state=tk.DISABLED)
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudieron mostrar las métricas: {str(e)}")
+    
+    def export_metrics(self):
+        """Exporta las métricas a un archivo JSON o de texto Prometheus."""
+        path = filedialog.asksaveasfilename(
+            title="Exportar métricas",
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Prometheus", "*.prom")]
+        )
+        if not path:
+            return
+        
+        try:
+            metrics.dump(path)
+            messagebox.showinfo("Métricas", f"Métricas exportadas en:\n{path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudieron exportar las métricas: {str(e)}")
+    
+    def toggle_profiling(self):
+        """Inicia o detiene una sesión de cProfile."""
+        if self.profiling_enabled.get():
+            metrics.start_profiling()
+            return
+        
+        path = filedialog.asksaveasfilename(
+            title="Guardar perfil",
+            defaultextension=".prof",
+            filetypes=[("cProfile", "*.prof")]
+        )
+        summary = metrics.stop_profiling(path or None)
+        print(summary)
+
+def parse_args(argv=None):
+    """Interpreta las opciones de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Registro de avistamientos de iguanas verdes")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Registra la duración de cada etapa del flujo de detección")
+    parser.add_argument("--metrics-dump", metavar="ARCHIVO",
+                        help="Guarda las métricas al cerrar (.json o .prom)")
+    parser.add_argument("--profile", metavar="ARCHIVO",
+                        help="Perfila toda la sesión con cProfile y guarda el resultado")
+    return parser.parse_args(argv)
 
 def main():
     """Función principal para ejecutar la aplicación."""
+    args = parse_args()
+    
+    if args.metrics or args.metrics_dump:
+        metrics.enabled = True
+    if args.profile:
+        metrics.start_profiling()
+    
     try:
         root = tk.Tk()
         app = IguanaSightingsApp(root)
@@ -894,6 +1048,12 @@ def main():
     except Exception as e:
         print(f"Error crítico al iniciar la aplicación: {e}")
         messagebox.showerror("Error Crítico", f"No se pudo iniciar la aplicación: {str(e)}")
+    
+    finally:
+        if args.profile:
+            metrics.stop_profiling(args.profile)
+        if args.metrics_dump:
+            metrics.dump(args.metrics_dump)
         
 if __name__ == "__main__":
     main()
\ No newline at end of file
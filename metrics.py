@@ -0,0 +1,195 @@
+import os
+import io
+import json
+import time
+import threading
+import cProfile
+import pstats
+from collections import deque
+
+# Cuantiles reportados para cada etapa
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _NullStage:
+    """Contexto vacío usado cuando las métricas están desactivadas."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _StageTimer:
+    """Mide la duración de una etapa y la registra al salir del contexto."""
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.increment(f"{self.name}_errors")
+        return False
+
+
+class Metrics:
+    """Histogramas de latencia por etapa y contadores del flujo detección → mapa."""
+
+    def __init__(self, enabled=False, window=1024):
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+        self._counters = {}
+        self._profiler = None
+
+    def stage(self, name):
+        """Regresa un contexto que cronometra la etapa indicada."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def observe(self, name, seconds):
+        """Registra una duración (en segundos) para la etapa indicada."""
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def increment(self, name, value=1):
+        """Incrementa un contador."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        """Descarta todas las muestras y contadores."""
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """Regresa un diccionario con percentiles por etapa y contadores."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            totals = {name: tuple(values) for name, values in self._totals.items()}
+            counters = dict(self._counters)
+
+        stages = {}
+        for name, values in samples.items():
+            count, total = totals[name]
+            stage = {
+                'count': count,
+                'sum_seconds': total,
+                'mean_ms': total / count * 1000 if count else 0.0,
+            }
+            for q in QUANTILES:
+                stage[f"p{int(q * 100)}_ms"] = _percentile(values, q) * 1000
+            stages[name] = stage
+
+        return {
+            'enabled': self.enabled,
+            'window': self.window,
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def to_json(self, indent=2):
+        """Exporta las métricas como JSON."""
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix="iguanapp"):
+        """Exporta las métricas en el formato de texto de Prometheus."""
+        snapshot = self.snapshot()
+        lines = []
+
+        if snapshot['stages']:
+            metric = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {metric} Duración de cada etapa del flujo de detección.")
+            lines.append(f"# TYPE {metric} summary")
+            for name, stage in sorted(snapshot['stages'].items()):
+                for q in QUANTILES:
+                    value = stage[f"p{int(q * 100)}_ms"] / 1000
+                    lines.append(f'{metric}{{stage="{name}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {stage["sum_seconds"]:.6f}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {stage["count"]}')
+
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Guarda las métricas en un archivo; usa Prometheus si la extensión es .prom o .txt."""
+        if os.path.splitext(path)[1].lower() in (".prom", ".txt"):
+            content = self.to_prometheus()
+        else:
+            content = self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    # Perfilado con cProfile
+    @property
+    def profiling(self):
+        return self._profiler is not None
+
+    def start_profiling(self):
+        """Inicia una sesión de cProfile (no hace nada si ya hay una activa)."""
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop_profiling(self, path=None, limit=30):
+        """Detiene la sesión de cProfile, la guarda en `path` y regresa un resumen."""
+        if self._profiler is None:
+            return ""
+        profiler = self._profiler
+        self._profiler = None
+        profiler.disable()
+
+        if path:
+            profiler.dump_stats(path)
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+def _percentile(sorted_values, q):
+    """Percentil por interpolación lineal sobre una lista ya ordenada."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+# Instancia global compartida por la aplicación; se activa con IGUANAPP_METRICS=1 o --metrics
+metrics = Metrics(enabled=os.environ.get("IGUANAPP_METRICS") == "1")
@@ -0,0 +1,127 @@
+import threading
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+# Rangos HSV (OpenCV, H en 0-179) de los colores típicos de una iguana verde:
+# verdes de adulto y juvenil, y naranjas/marrones de machos en época reproductiva.
+IGUANA_HUE_RANGES = ((30, 90), (5, 25))
+
+
+class PrefilterCascade:
+    """Descarta de forma barata los cuadros vacíos antes de ejecutar YOLO.
+
+    Cada fuente (por ejemplo, la carpeta de una cámara trampa) mantiene un fondo
+    promedio del cuadro reducido. La puntuación de un cuadro es la fracción de
+    píxeles que cambian respecto al fondo, con más peso si tienen colores de
+    iguana. Solo se descartan cuadros con puntuación menor a `threshold`; bajar
+    el umbral prioriza no perder iguanas sobre ahorrar tiempo.
+
+    El fondo solo se forma con cuadros que el modelo confirmó vacíos (ver
+    `record_result`), así una iguana quieta nunca pasa a ser parte del fondo.
+    Mientras una fuente no tenga fondo, o si el último resultado del modelo en
+    esa fuente fue positivo, no se descarta ningún cuadro.
+    """
+
+    def __init__(self, threshold=0.004, size=64, pixel_delta=25, colour_weight=2.0,
+                 background_alpha=0.05):
+        self.threshold = threshold
+        self.size = size
+        self.pixel_delta = pixel_delta
+        self.colour_weight = colour_weight
+        self.background_alpha = background_alpha
+
+        self._backgrounds = {}
+        self._positive = {}
+        self._lock = threading.Lock()
+
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self.time_saved_s = 0.0
+        self._inference_s = None
+
+    def _reduce(self, image):
+        small = cv2.resize(image, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        frame = small.astype(np.float32)
+        # Compensar cambios globales de iluminación en cada canal
+        frame -= frame.mean(axis=(0, 1))
+        return small, frame
+
+    def score(self, image, source=None):
+        """Puntuación de actividad del cuadro; None si todavía no puede descartarse."""
+        small, frame = self._reduce(image)
+
+        with self._lock:
+            background = self._backgrounds.get(source)
+            if background is None or background.shape != frame.shape or self._positive.get(source):
+                return None
+            # Se compara por canal para no perder cambios de color con el mismo brillo
+            moving = (np.abs(frame - background) > self.pixel_delta).any(axis=2)
+
+        motion = moving.mean()
+        if not moving.any():
+            return 0.0
+
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        hue, saturation = hsv[..., 0], hsv[..., 1]
+        coloured = np.zeros(moving.shape, dtype=bool)
+        for low, high in IGUANA_HUE_RANGES:
+            coloured |= (hue >= low) & (hue <= high)
+        coloured &= saturation > 60
+
+        return float(motion + self.colour_weight * (moving & coloured).mean())
+
+    def should_skip(self, image, source=None):
+        """Indica si el cuadro puede descartarse sin ejecutar el modelo."""
+        with metrics.stage("prefilter"):
+            score = self.score(image, source)
+
+        skip = score is not None and score < self.threshold
+        with self._lock:
+            self.frames_seen += 1
+            if skip:
+                self.frames_skipped += 1
+                if self._inference_s is not None:
+                    self.time_saved_s += self._inference_s
+
+        metrics.increment("prefilter_frames")
+        if skip:
+            metrics.increment("prefilter_skipped")
+        return skip
+
+    def record_result(self, image, source, is_iguana):
+        """Registra el resultado del modelo; solo los cuadros vacíos actualizan el fondo."""
+        with self._lock:
+            self._positive[source] = is_iguana
+        if is_iguana:
+            return
+
+        _, frame = self._reduce(image)
+        with self._lock:
+            background = self._backgrounds.get(source)
+            if background is None or background.shape != frame.shape:
+                self._backgrounds[source] = frame
+            else:
+                background += self.background_alpha * (frame - background)
+
+    def record_inference(self, seconds, images=1):
+        """Registra el tiempo real del modelo para estimar el tiempo ahorrado."""
+        per_image = seconds / max(images, 1)
+        with self._lock:
+            if self._inference_s is None:
+                self._inference_s = per_image
+            else:
+                self._inference_s += 0.1 * (per_image - self._inference_s)
+
+    def stats(self):
+        """Cuadros vistos, descartados y tiempo de inferencia ahorrado (estimado)."""
+        with self._lock:
+            return {
+                'frames_seen': self.frames_seen,
+                'frames_skipped': self.frames_skipped,
+                'skip_rate': self.frames_skipped / self.frames_seen if self.frames_seen else 0.0,
+                'time_saved_s': self.time_saved_s,
+                'inference_ms': (self._inference_s or 0.0) * 1000,
+            }
@@ -0,0 +1,297 @@
+import os
+import sys
+import hashlib
+import sqlite3
+import argparse
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import core
+from metrics import metrics
+
+# Límites de los rangos del reporte de cambios de confianza
+SHIFT_BINS = (0.05, 0.1, 0.2, 0.5)
+
+
+def model_version(model_path):
+    """Versión del modelo: prefijo del SHA-256 del archivo de pesos."""
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def decode(path):
+    with metrics.stage("decode"):
+        return cv2.imread(path) if path and os.path.exists(path) else None
+
+
+class RescoreJob:
+    """Recalcula la confianza de los avistamientos guardados con un modelo nuevo.
+
+    Las filas se leen por id y se decodifican en `decode_workers` hilos con a lo
+    sumo `decode_workers` imágenes adelantadas, así en memoria solo hay un lote
+    del modelo (`batch_size`) más las imágenes en decodificación. Cada bloque de
+    `chunk_size` filas se escribe en una sola transacción junto con el avance
+    del trabajo en `rescore_jobs`, así un trabajo interrumpido continúa después
+    del último bloque guardado. Las filas que ya tienen `model_version` se
+    omiten. En modo de prueba (`dry_run`) no se escribe nada y solo se reporta
+    cómo cambiarían las puntuaciones.
+    """
+
+    def __init__(self, db_path, model, version, chunk_size=256, batch_size=16,
+                 decode_workers=4, dry_run=False, limit=None):
+        self.db_path = db_path
+        self.model = model
+        self.version = version
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.dry_run = dry_run
+        self.limit = limit
+
+        self.stats = {'processed': 0, 'changed': 0, 'failed': 0, 'flipped': 0,
+                      'shift_sum': 0.0, 'bins': [0] * (len(SHIFT_BINS) + 1)}
+        self.last_id = 0
+
+        core.init_database(self.db_path)
+        self.init_jobs()
+
+    # Avance del trabajo
+    def init_jobs(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS rescore_jobs (
+            model_version TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            changed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
+        )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def checkpoint(self, conn):
+        """Último id procesado por el trabajo de esta versión (0 si es nuevo)."""
+        if self.dry_run:
+            return 0
+        conn.execute('''
+        INSERT OR IGNORE INTO rescore_jobs (model_version, started_at) VALUES (?, ?)
+        ''', (self.version, datetime.now().isoformat()))
+        conn.commit()
+        row = conn.execute("SELECT last_id FROM rescore_jobs WHERE model_version = ?",
+                           (self.version,)).fetchone()
+        return row[0]
+
+    def fetch_chunk(self, conn, after_id):
+        with metrics.stage("db_query"):
+            return conn.execute('''
+            SELECT id, saved_image_path, detection_confidence, detections_count
+            FROM sightings
+            WHERE id > ? AND model_version IS NOT ?
+            ORDER BY id
+            LIMIT ?
+            ''', (after_id, self.version, self.chunk_size)).fetchall()
+
+    def stream_rows(self, conn, after_id):
+        """Recorre las filas pendientes por id, leyendo `chunk_size` a la vez."""
+        while True:
+            rows = self.fetch_chunk(conn, after_id)
+            if not rows:
+                return
+            yield from rows
+            after_id = rows[-1][0]
+
+    def decoded(self, pool, rows):
+        """Decodifica las filas en orden con a lo sumo `decode_workers` imágenes adelantadas."""
+        pending = deque()
+        for row in rows:
+            if len(pending) >= self.decode_workers:
+                done_row, future = pending.popleft()
+                yield done_row, future.result()
+            pending.append((row, pool.submit(decode, row[1])))
+        while pending:
+            done_row, future = pending.popleft()
+            yield done_row, future.result()
+
+    # Proceso
+    def run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        last_id = self.checkpoint(conn)
+        if last_id:
+            print(f"Reanudando el trabajo {self.version} después del id {last_id}")
+
+        rows = self.stream_rows(conn, last_id)
+        if self.limit is not None:
+            rows = (row for _, row in zip(range(self.limit), rows))
+
+        batch = []
+        chunk = []
+        with ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="decode") as pool:
+            for row, image in self.decoded(pool, rows):
+                batch.append((row, image))
+                if len(batch) >= self.batch_size:
+                    chunk.extend(self.score_batch(batch))
+                    batch = []
+                if len(chunk) >= self.chunk_size:
+                    self.write_chunk(conn, chunk)
+                    chunk = []
+            chunk.extend(self.score_batch(batch))
+            if chunk:
+                self.write_chunk(conn, chunk)
+
+        # Terminado si no quedan filas pendientes para esta versión
+        if not self.dry_run and not self.fetch_chunk(conn, self.last_id):
+            conn.execute("UPDATE rescore_jobs SET finished_at = ? WHERE model_version = ?",
+                         (datetime.now().isoformat(), self.version))
+            conn.commit()
+        conn.close()
+        return self.report()
+
+    def score_batch(self, batch):
+        """Pasa las imágenes legibles del lote por el modelo; regresa (fila, resultado o None)."""
+        decoded = [(row, image) for row, image in batch if image is not None]
+        results = core.run_detection_batch(self.model, [image for _, image in decoded])
+        by_id = {row[0]: result for (row, _), result in zip(decoded, results)}
+        return [(row, by_id.get(row[0])) for row, _ in batch]
+
+    def write_chunk(self, conn, chunk):
+        updates = []
+        changed, failed = self.stats['changed'], self.stats['failed']
+        rescored_at = datetime.now().isoformat()
+
+        for (sighting_id, _, old_confidence, old_count), result in chunk:
+            if result is None:
+                self.stats['failed'] += 1
+                continue
+
+            self.record_shift(old_confidence or 0.0, old_count or 0, result)
+            updates.append((result['confidence'], result['detections_count'],
+                            self.version, rescored_at, sighting_id))
+
+        self.last_id = chunk[-1][0][0]
+        self.stats['processed'] += len(chunk)
+        metrics.increment("rescored", len(updates))
+        print(f"Reevaluados {self.stats['processed']} avistamientos (id {self.last_id})")
+        if self.dry_run:
+            return
+
+        # Resultados y avance en la misma transacción
+        with metrics.stage("db_update"):
+            conn.executemany('''
+            UPDATE sightings
+            SET detection_confidence = ?, detections_count = ?, model_version = ?, rescored_at = ?
+            WHERE id = ?
+            ''', updates)
+            conn.execute('''
+            UPDATE rescore_jobs
+            SET last_id = ?, processed = processed + ?, changed = changed + ?,
+                failed = failed + ?, updated_at = ?
+            WHERE model_version = ?
+            ''', (self.last_id, len(chunk), self.stats['changed'] - changed,
+                  self.stats['failed'] - failed, rescored_at, self.version))
+            conn.commit()
+
+    def record_shift(self, old_confidence, old_count, result):
+        shift = abs(result['confidence'] - old_confidence)
+        self.stats['shift_sum'] += shift
+        if shift > 1e-6 or result['detections_count'] != old_count:
+            self.stats['changed'] += 1
+        if (old_count > 0) != result['is_iguana']:
+            self.stats['flipped'] += 1
+
+        for n, limit in enumerate(SHIFT_BINS):
+            if shift < limit:
+                self.stats['bins'][n] += 1
+                break
+        else:
+            self.stats['bins'][-1] += 1
+
+    def report(self):
+        scored = self.stats['processed'] - self.stats['failed']
+        return {
+            'model_version': self.version,
+            'dry_run': self.dry_run,
+            'processed': self.stats['processed'],
+            'failed': self.stats['failed'],
+            'changed': self.stats['changed'],
+            'flipped': self.stats['flipped'],
+            'mean_shift': self.stats['shift_sum'] / scored if scored else 0.0,
+            'shift_histogram': self.stats['bins'],
+        }
+
+
+def print_report(report):
+    print(f"\nModelo {report['model_version']}{' (prueba, sin cambios guardados)' if report['dry_run'] else ''}")
+    print(f"Avistamientos revisados: {report['processed']}")
+    print(f"Sin imagen o ilegibles: {report['failed']}")
+    print(f"Con puntuación distinta: {report['changed']}")
+    print(f"Cambian entre iguana / sin iguana: {report['flipped']}")
+    print(f"Cambio promedio de confianza: {report['mean_shift'] * 100:.2f} puntos")
+
+    limits = ("0",) + tuple(f"{limit * 100:g}" for limit in SHIFT_BINS) + ("100",)
+    for n, count in enumerate(report['shift_histogram']):
+        print(f"  {limits[n]:>3} - {limits[n + 1]:>3} puntos: {count}")
+
+
+def parse_args(argv=None):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Reevalúa los avistamientos guardados con un modelo nuevo")
+    parser.add_argument("--db", default="iguana_sightings.db", help="Base de datos de avistamientos")
+    parser.add_argument("--model", default=os.path.join(base_dir, "yolo_model", "best.pt"))
+    parser.add_argument("--model-version",
+                        help="Etiqueta de la versión del modelo (por omisión, hash de los pesos)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Filas guardadas por transacción (y por punto de control)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Imágenes por pasada del modelo")
+    parser.add_argument("--decode-workers", type=int, default=4,
+                        help="Hilos de decodificación (y máximo de imágenes adelantadas)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="No guarda cambios; solo reporta cómo cambiarían las puntuaciones")
+    parser.add_argument("--limit", type=int, help="Máximo de avistamientos a revisar (útil con --dry-run)")
+    parser.add_argument("--metrics-dump", metavar="ARCHIVO",
+                        help="Guarda las métricas al terminar (.json o .prom)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics_dump:
+        metrics.enabled = True
+
+    try:
+        model = core.load_model(args.model)
+    except Exception as e:
+        print(f"No se pudo cargar el modelo YOLO: {e}")
+        return 1
+
+    job = RescoreJob(
+        args.db, model, args.model_version or model_version(args.model),
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        decode_workers=args.decode_workers,
+        dry_run=args.dry_run,
+        limit=args.limit,
+    )
+
+    try:
+        print_report(job.run())
+    except KeyboardInterrupt:
+        # El último bloque guardado queda registrado; volver a ejecutar continúa desde ahí
+        print("\nTrabajo interrumpido; se reanudará desde el último bloque guardado")
+        return 130
+    finally:
+        if args.metrics_dump:
+            metrics.dump(args.metrics_dump)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,420 @@
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import numpy as np
+
+import core
+import geo
+from metrics import metrics
+
+MAX_BODY_BYTES = 25 * 1024 * 1024
+
+# Extensión del archivo guardado según el tipo de contenido recibido
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/bmp": ".bmp",
+    "image/tiff": ".tiff",
+    "image/webp": ".webp",
+}
+
+STATUS_TEXT = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 408: "Request Timeout", 413: "Payload Too Large", 422: "Unprocessable Entity",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class Overloaded(Exception):
+    """La cola de inferencia está llena; la solicitud se rechaza con 503."""
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class MicroBatcher:
+    """Agrupa las solicitudes concurrentes en una sola pasada del modelo.
+
+    La primera imagen que llega abre una ventana de `window_ms`; todo lo que
+    llegue dentro de esa ventana (hasta `max_batch`) se procesa en el mismo
+    lote. La cola es acotada: cuando se llena, las solicitudes nuevas se
+    rechazan de inmediato en lugar de acumular latencia.
+    """
+
+    def __init__(self, model, max_batch=8, window_ms=10.0, max_queue=64):
+        self.model = model
+        self.max_batch = max_batch
+        self.window_s = window_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # Un solo hilo de inferencia: el modelo no se comparte entre hilos
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    def check_capacity(self):
+        """Rechaza antes de decodificar si la cola ya está llena."""
+        if self.queue.full():
+            metrics.increment("service_shed")
+            raise Overloaded()
+
+    async def submit(self, image):
+        """Encola una imagen y espera su resultado junto con los tiempos del lote."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((image, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            metrics.increment("service_shed")
+            raise Overloaded()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window_s
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, core.run_detection_batch, self.model, [item[0] for item in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            metrics.increment("service_batches")
+            metrics.increment("service_batched_images", len(batch))
+            for (_, future, enqueued), result in zip(batch, results):
+                if future.done():
+                    continue
+                future.set_result((result, {
+                    'queue_ms': (started - enqueued) * 1000,
+                    'inference_ms': (finished - started) * 1000,
+                    'batch_size': len(batch),
+                }))
+
+
+class DetectionService:
+    """Servicio HTTP (solo biblioteca estándar + asyncio) para detectar y guardar avistamientos."""
+
+    def __init__(self, model, db_path, saved_images_dir, max_batch=8, window_ms=10.0,
+                 max_queue=64, max_connections=256, decode_workers=2, request_timeout_s=10.0):
+        self.db_path = db_path
+        self.saved_images_dir = saved_images_dir
+        self.batcher = MicroBatcher(model, max_batch=max_batch, window_ms=window_ms, max_queue=max_queue)
+        self.max_connections = max_connections
+        # Tiempo máximo para recibir la solicitud completa; evita que clientes lentos ocupen conexiones
+        self.request_timeout_s = request_timeout_s
+        self.decode_executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        # Escrituras a SQLite y al disco en un solo hilo
+        self.store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self._connections = 0
+
+        os.makedirs(self.saved_images_dir, exist_ok=True)
+        core.init_database(self.db_path)
+
+        self.routes = {
+            ("POST", "/detect"): self.handle_detect,
+            ("POST", "/sightings"): self.handle_save_sighting,
+            ("GET", "/sightings"): self.handle_query,
+            ("GET", "/metrics"): self.handle_metrics,
+            ("GET", "/health"): self.handle_health,
+        }
+
+    # Servidor
+    async def serve(self, host, port):
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Servicio de detección escuchando en http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        started = time.perf_counter()
+        self._connections += 1
+        try:
+            if self._connections > self.max_connections:
+                metrics.increment("service_shed")
+                await self.respond(writer, 503, {'error': "Servidor ocupado"}, started,
+                                   extra_headers={'Retry-After': "1"})
+                return
+
+            try:
+                try:
+                    method, target, headers, body = await asyncio.wait_for(
+                        self.read_request(reader), self.request_timeout_s)
+                except asyncio.TimeoutError:
+                    raise HttpError(408, "Tiempo de espera agotado al recibir la solicitud")
+                url = urlsplit(target)
+                handler = self.routes.get((method, url.path))
+                if handler is None:
+                    known_path = any(path == url.path for _, path in self.routes)
+                    raise HttpError(405 if known_path else 404, "Ruta no encontrada")
+
+                status, payload, timings = await handler(parse_qs(url.query), headers, body)
+                await self.respond(writer, status, payload, started, timings)
+            except Overloaded:
+                await self.respond(writer, 503, {'error': "Cola de inferencia llena"}, started,
+                                   extra_headers={'Retry-After': "1"})
+            except HttpError as e:
+                await self.respond(writer, e.status, {'error': e.message}, started)
+            except Exception as e:
+                print(f"Error en la solicitud: {e}")
+                await self.respond(writer, 500, {'error': str(e)}, started)
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def read_request(self, reader):
+        """Lee una solicitud HTTP/1.1 sencilla (sin chunked encoding)."""
+        try:
+            return await self._read_request(reader)
+        except asyncio.IncompleteReadError:
+            raise HttpError(400, "Solicitud incompleta")
+        except asyncio.LimitOverrunError:
+            raise HttpError(400, "Encabezado demasiado largo")
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            raise HttpError(400, "Solicitud vacía")
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Línea de solicitud inválida")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HttpError(400, "Content-Length inválido")
+        if length < 0:
+            raise HttpError(400, "Content-Length inválido")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "La imagen es demasiado grande")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def respond(self, writer, status, payload, started, timings=None, extra_headers=None):
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+
+        total_ms = (time.perf_counter() - started) * 1000
+        metrics.observe("service_request", total_ms / 1000)
+        headers = {
+            'Content-Type': content_type,
+            'Content-Length': str(len(body)),
+            'Connection': "close",
+            'X-Total-Time-Ms': f"{total_ms:.2f}",
+        }
+        if timings:
+            headers['X-Queue-Time-Ms'] = f"{timings['queue_ms']:.2f}"
+            headers['X-Inference-Time-Ms'] = f"{timings['inference_ms']:.2f}"
+            headers['X-Batch-Size'] = str(timings['batch_size'])
+            headers['Server-Timing'] = (f"queue;dur={timings['queue_ms']:.2f}, "
+                                        f"inference;dur={timings['inference_ms']:.2f}, "
+                                        f"total;dur={total_ms:.2f}")
+        headers.update(extra_headers or {})
+
+        head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    # Endpoints
+    async def detect(self, body):
+        """Decodifica la imagen y la envía al lote de inferencia."""
+        if not body:
+            raise HttpError(400, "Se requiere una imagen en el cuerpo de la solicitud")
+
+        # Bajo sobrecarga se rechaza sin pagar la decodificación
+        self.batcher.check_capacity()
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(self.decode_executor, decode_bytes, body)
+        if image is None:
+            raise HttpError(400, "No se pudo decodificar la imagen")
+        return await self.batcher.submit(image)
+
+    async def handle_detect(self, query, headers, body):
+        result, timings = await self.detect(body)
+        return 200, result, timings
+
+    async def handle_save_sighting(self, query, headers, body):
+        """Detecta y, si hay iguana, guarda el avistamiento (coordenadas por parámetro o EXIF).
+
+        Las coordenadas se validan antes de la inferencia para no gastar una
+        pasada del modelo en una solicitud que se va a rechazar.
+        """
+        if not body:
+            raise HttpError(400, "Se requiere una imagen en el cuerpo de la solicitud")
+        try:
+            if 'lat' in query and 'lon' in query:
+                coords = float(query['lat'][0]), float(query['lon'][0])
+            else:
+                coords = read_gps_from_bytes(body)
+        except ValueError:
+            raise HttpError(400, "Las coordenadas deben ser números válidos.")
+        if coords is None:
+            raise HttpError(400, "Faltan las coordenadas (parámetros lat y lon o GPS en el EXIF)")
+
+        is_valid, error_msg = geo.get_validator().validate_point(*coords)
+        if not is_valid:
+            raise HttpError(422, error_msg)
+
+        result, timings = await self.detect(body)
+        if not result['is_iguana']:
+            return 422, {'error': "No se detectaron iguanas", 'detection': result}, timings
+
+        content_type = headers.get("content-type", "image/jpeg").split(";")[0].strip()
+        extension = CONTENT_TYPE_EXTENSIONS.get(content_type, ".jpg")
+        original_name = query.get('filename', [f"upload{extension}"])[0]
+
+        loop = asyncio.get_running_loop()
+        sighting_id, saved_path = await loop.run_in_executor(
+            self.store_executor, self.store_sighting, body, original_name, extension, coords, result)
+
+        return 201, {'id': sighting_id, 'saved_image_path': saved_path,
+                     'latitude': coords[0], 'longitude': coords[1], 'detection': result}, timings
+
+    def store_sighting(self, body, original_name, extension, coords, result):
+        saved_path = core.new_saved_image_path(self.saved_images_dir, f"upload{extension}")
+        with metrics.stage("copy"):
+            with open(saved_path, "wb") as f:
+                f.write(body)
+
+        lat, lon = coords
+        sighting_id = core.insert_sighting(
+            self.db_path, lat, lon, original_name, saved_path,
+            result['confidence'], result['detections_count'])
+        return sighting_id, saved_path
+
+    async def handle_query(self, query, headers, body):
+        try:
+            limit = min(int(query.get('limit', ["100"])[0]), 1000)
+            offset = int(query.get('offset', ["0"])[0])
+        except ValueError:
+            raise HttpError(400, "limit y offset deben ser enteros")
+        since = query.get('since', [None])[0]
+
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(
+            self.store_executor, core.query_sightings, self.db_path, since, limit, offset)
+        return 200, {'sightings': rows, 'count': len(rows)}, None
+
+    async def handle_metrics(self, query, headers, body):
+        return 200, metrics.to_prometheus(), None
+
+    async def handle_health(self, query, headers, body):
+        return 200, {'status': "ok", 'queue': self.batcher.queue.qsize()}, None
+
+
+def decode_bytes(body):
+    """Decodifica una imagen recibida como bytes (BGR, igual que `cv2.imread`)."""
+    with metrics.stage("decode"):
+        return cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def read_gps_from_bytes(body):
+    try:
+        return core.read_gps_coordinates(io.BytesIO(body))
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Servicio HTTP de detección de iguanas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default="iguana_sightings.db", help="Base de datos de avistamientos")
+    parser.add_argument("--model", default=os.path.join(base_dir, "yolo_model", "best.pt"))
+    parser.add_argument("--saved-dir", default=os.path.join(base_dir, "saved_sightings"))
+    parser.add_argument("--batch-size", type=int, default=8, help="Máximo de imágenes por lote")
+    parser.add_argument("--batch-window-ms", type=float, default=10.0,
+                        help="Tiempo máximo de espera para completar un lote")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="Imágenes en espera antes de rechazar solicitudes (503)")
+    parser.add_argument("--max-connections", type=int, default=256)
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument("--request-timeout", type=float, default=10.0,
+                        help="Segundos para recibir una solicitud completa antes de responder 408")
+    parser.add_argument("--metrics", action="store_true", help="Registra métricas (expuestas en /metrics)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        metrics.enabled = True
+
+    try:
+        model = core.load_model(args.model)
+    except Exception as e:
+        print(f"No se pudo cargar el modelo YOLO: {e}")
+        return 1
+
+    service = DetectionService(
+        model, args.db, args.saved_dir,
+        max_batch=args.batch_size,
+        window_ms=args.batch_window_ms,
+        max_queue=args.max_queue,
+        max_connections=args.max_connections,
+        decode_workers=args.decode_workers,
+        request_timeout_s=args.request_timeout,
+    )
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Servicio detenido")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+import os
+import time
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from PIL import Image
+from metrics import metrics
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp")
+
+# Extensión de salida para cada formato de recompresión
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+# Columnas agregadas al índice después de su primera versión
+INDEX_MIGRATIONS = (
+    ("added_at", "REAL"),
+)
+
+
+def image_name(path):
+    """Nombre del archivo sin importar si la ruta usa separadores de Windows o Unix."""
+    return path.replace("\\", "/").rsplit("/", 1)[-1]
+
+
+class StorageManager:
+    """Índice, cuotas y mantenimiento de la carpeta de imágenes guardadas.
+
+    El índice vive en la misma base de datos que los avistamientos. La carpeta
+    solo se vuelve a recorrer cuando cambia su fecha de modificación, y aun así
+    solo se consultan los archivos nuevos.
+    """
+
+    def __init__(self, db_path, images_dir, quota_mb=None, recompress_after_days=30,
+                 recompress_format="JPEG", quality=85, orphan_grace_hours=24,
+                 auto_prune=False):
+        if recompress_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Formato de recompresión no soportado: {recompress_format}")
+
+        self.db_path = db_path
+        self.images_dir = images_dir
+        self.quota_bytes = int(quota_mb * 1024 * 1024) if quota_mb else None
+        self.recompress_after_days = recompress_after_days
+        self.recompress_format = recompress_format
+        self.quality = quality
+        self.orphan_grace_hours = orphan_grace_hours
+        self.auto_prune = auto_prune
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_summary = None
+
+        self.init_index()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_index(self):
+        """Crea las tablas del índice si no existen."""
+        conn = self._connect()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS image_index (
+            filename TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            recompressed INTEGER NOT NULL DEFAULT 0,
+            added_at REAL
+        )
+        ''')
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(image_index)")}
+        for column, column_type in INDEX_MIGRATIONS:
+            if column not in columns:
+                conn.execute(f"ALTER TABLE image_index ADD COLUMN {column} {column_type}")
+        # Sin fecha de registro, lo más cercano es la fecha del archivo
+        conn.execute("UPDATE image_index SET added_at = mtime WHERE added_at IS NULL")
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS storage_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''')
+        conn.commit()
+        conn.close()
+
+    # Índice
+    def _dir_mtime(self):
+        return str(os.stat(self.images_dir).st_mtime_ns)
+
+    @contextmanager
+    def tracking_changes(self):
+        """Envuelve cambios propios en la carpeta que ya se reflejan en el índice.
+
+        Si el índice estaba al día antes del cambio, se guarda la nueva fecha de
+        la carpeta y el siguiente `refresh` no necesita recorrerla.
+        """
+        before = self._dir_mtime()
+        yield
+        after = self._dir_mtime()
+        if after != before:
+            conn = self._connect()
+            conn.execute('''
+            UPDATE storage_state SET value = ? WHERE key = 'dir_mtime' AND value = ?
+            ''', (after, before))
+            conn.commit()
+            conn.close()
+
+    def add_copy(self, source_path, target_path):
+        """Copia una imagen a la carpeta y la registra en el índice."""
+        with self.tracking_changes():
+            with metrics.stage("copy"):
+                shutil.copy2(source_path, target_path)
+            self.register(target_path)
+
+    def register(self, path, recompressed=False):
+        """Agrega o actualiza un archivo en el índice sin recorrer la carpeta.
+
+        Para que la fecha de la carpeta también quede al día, el archivo debe
+        escribirse dentro de `tracking_changes` (como lo hace `add_copy`).
+        `added_at` guarda cuándo llegó el archivo a la carpeta: `copy2` conserva
+        la fecha de la foto original, que no sirve para el periodo de gracia.
+        """
+        stat = os.stat(path)
+        conn = self._connect()
+        conn.execute('''
+        INSERT OR REPLACE INTO image_index (filename, size, mtime, recompressed, added_at)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (os.path.basename(path), stat.st_size, stat.st_mtime, int(recompressed), time.time()))
+        conn.commit()
+        conn.close()
+
+    def refresh(self, force=False):
+        """Sincroniza el índice con la carpeta usando `os.scandir`.
+
+        Regresa la cantidad de archivos agregados o eliminados del índice.
+        """
+        if not os.path.isdir(self.images_dir):
+            return 0
+
+        with metrics.stage("storage_refresh"):
+            dir_mtime = str(os.stat(self.images_dir).st_mtime_ns)
+            conn = self._connect()
+            row = conn.execute("SELECT value FROM storage_state WHERE key = 'dir_mtime'").fetchone()
+            if row and row[0] == dir_mtime and not force:
+                conn.close()
+                return 0
+
+            indexed = {name for (name,) in conn.execute("SELECT filename FROM image_index")}
+            present = set()
+            added = []
+            with os.scandir(self.images_dir) as entries:
+                for entry in entries:
+                    if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                        continue
+                    present.add(entry.name)
+                    # Solo se consultan los datos de archivos que no están en el índice
+                    if entry.name not in indexed:
+                        stat = entry.stat()
+                        added.append((entry.name, stat.st_size, stat.st_mtime))
+
+            removed = [(name,) for name in indexed - present]
+            now = time.time()
+            conn.executemany('''
+            INSERT INTO image_index (filename, size, mtime, added_at) VALUES (?, ?, ?, ?)
+            ''', [row + (now,) for row in added])
+            conn.executemany("DELETE FROM image_index WHERE filename = ?", removed)
+            conn.execute('''
+            INSERT OR REPLACE INTO storage_state (key, value) VALUES ('dir_mtime', ?)
+            ''', (dir_mtime,))
+            conn.commit()
+            conn.close()
+
+        return len(added) + len(removed)
+
+    def usage(self):
+        """Regresa la cantidad de archivos y los bytes ocupados según el índice."""
+        conn = self._connect()
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM image_index").fetchone()
+        conn.close()
+        return count, total
+
+    def quota_status(self):
+        """Uso actual frente a la cuota configurada."""
+        count, total = self.usage()
+        return {
+            'files': count,
+            'total_bytes': total,
+            'quota_bytes': self.quota_bytes,
+            'within_quota': not self.quota_bytes or total <= self.quota_bytes,
+        }
+
+    # Preferencias guardadas junto al índice
+    def get_setting(self, key, default=None):
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM storage_state WHERE key = ?", (key,)).fetchone()
+        conn.close()
+        return row[0] if row else default
+
+    def set_setting(self, key, value):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO storage_state (key, value) VALUES (?, ?)", (key, value))
+        conn.commit()
+        conn.close()
+
+    def referenced_names(self, conn):
+        """Nombres de las imágenes que algún avistamiento referencia."""
+        return {image_name(path) for (path,) in conn.execute("SELECT saved_image_path FROM sightings")}
+
+    def _grace_cutoff(self):
+        return time.time() - self.orphan_grace_hours * 3600
+
+    # Mantenimiento
+    def prune_orphans(self, dry_run=False):
+        """Elimina las imágenes que ningún avistamiento referencia.
+
+        Se respeta un periodo de gracia desde que la imagen llegó a la carpeta
+        para no borrar copias recientes que aún no se guardan como avistamiento.
+        Si la base no tiene avistamientos no se elimina nada: lo más probable es
+        que sea una base distinta (o nueva) y no la que referencia la carpeta.
+        """
+        conn = self._connect()
+        referenced = self.referenced_names(conn)
+        if not referenced:
+            conn.close()
+            print(f"No hay avistamientos en {self.db_path}; no se eliminan imágenes de {self.images_dir}")
+            return 0, 0
+        candidates = conn.execute(
+            "SELECT filename, size FROM image_index WHERE added_at < ?", (self._grace_cutoff(),)
+        ).fetchall()
+
+        orphans = [(filename, size) for filename, size in candidates if filename not in referenced]
+        if dry_run:
+            conn.close()
+            return len(orphans), sum(size for _, size in orphans)
+
+        pruned = []
+        freed = 0
+        with self.tracking_changes():
+            for filename, size in orphans:
+                try:
+                    os.remove(os.path.join(self.images_dir, filename))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"No se pudo eliminar {filename}: {e}")
+                    continue
+                pruned.append((filename,))
+                freed += size
+
+            conn.executemany("DELETE FROM image_index WHERE filename = ?", pruned)
+            conn.commit()
+        conn.close()
+        return len(pruned), freed
+
+    def recompress(self, filename):
+        """Recomprime una imagen conservando el EXIF y actualiza sus referencias.
+
+        Regresa los bytes liberados (0 si la versión recomprimida no es más pequeña).
+        """
+        with self.tracking_changes():
+            return self._recompress(filename)
+
+    def _recompressed_name(self, filename):
+        """Nombre libre para la versión recomprimida; nunca reemplaza otro archivo."""
+        stem = os.path.splitext(filename)[0]
+        extension = FORMAT_EXTENSIONS[self.recompress_format]
+        new_filename = stem + extension
+        n = 0
+        while new_filename == filename or os.path.exists(os.path.join(self.images_dir, new_filename)):
+            n += 1
+            new_filename = f"{stem}_c{n if n > 1 else ''}{extension}"
+        return new_filename
+
+    def _recompress(self, filename):
+        source = os.path.join(self.images_dir, filename)
+        new_filename = self._recompressed_name(filename)
+        target = os.path.join(self.images_dir, new_filename)
+
+        with metrics.stage("recompress"):
+            with Image.open(source) as img:
+                exif = img.getexif()
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                img.save(target, self.recompress_format, quality=self.quality, exif=exif)
+        # Conservar la fecha original: la antigüedad decide la recompresión y el periodo de gracia
+        shutil.copystat(source, target)
+
+        old_size = os.path.getsize(source)
+        new_size = os.path.getsize(target)
+        conn = self._connect()
+        if new_size >= old_size:
+            # No vale la pena: se conserva el original y se marca para no reintentar
+            os.remove(target)
+            conn.execute("UPDATE image_index SET recompressed = 1 WHERE filename = ?", (filename,))
+            conn.commit()
+            conn.close()
+            return 0
+
+        # Actualizar las rutas de los avistamientos que usan la imagen
+        rows = conn.execute(
+            "SELECT id, saved_image_path FROM sightings WHERE saved_image_path LIKE ?",
+            (f"%{filename}",)
+        ).fetchall()
+        updates = [(path[:-len(filename)] + new_filename, sighting_id)
+                   for sighting_id, path in rows if image_name(path) == filename]
+        conn.executemany("UPDATE sightings SET saved_image_path = ? WHERE id = ?", updates)
+        stat = os.stat(target)
+        conn.execute('''
+        INSERT OR REPLACE INTO image_index (filename, size, mtime, recompressed, added_at)
+        SELECT ?, ?, ?, 1, added_at FROM image_index WHERE filename = ?
+        ''', (new_filename, stat.st_size, stat.st_mtime, filename))
+        conn.execute("DELETE FROM image_index WHERE filename = ?", (filename,))
+        conn.commit()
+        conn.close()
+
+        os.remove(source)
+        metrics.increment("images_recompressed")
+        return old_size - new_size
+
+    def recompress_old(self, older_than_days=None, limit=None):
+        """Recomprime las imágenes originales más antiguas que el umbral indicado."""
+        days = self.recompress_after_days if older_than_days is None else older_than_days
+        cutoff = time.time() - days * 86400
+        conn = self._connect()
+        # Las copias recientes tampoco se tocan: su avistamiento puede no estar guardado aún
+        query = '''
+        SELECT filename FROM image_index
+        WHERE recompressed = 0 AND mtime < ? AND added_at < ?
+        ORDER BY mtime
+        '''
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        candidates = [name for (name,) in conn.execute(query, (cutoff, self._grace_cutoff()))]
+        conn.close()
+
+        recompressed = 0
+        freed = 0
+        for filename in candidates:
+            if self._stop.is_set():
+                break
+            try:
+                saved = self.recompress(filename)
+            except Exception as e:
+                print(f"No se pudo recomprimir {filename}: {e}")
+                continue
+            if saved:
+                recompressed += 1
+                freed += saved
+        return recompressed, freed
+
+    def enforce_quota(self):
+        """Recomprime desde las imágenes más antiguas hasta quedar bajo la cuota.
+
+        Las imágenes dentro del periodo de gracia no se recomprimen, igual que en
+        `prune_orphans`.
+
+        Si no alcanza, se eliminan las imágenes huérfanas (con su periodo de
+        gracia). Las imágenes referenciadas por avistamientos nunca se eliminan;
+        si aun así se excede la cuota, se informa en el resultado. Regresa
+        (dentro_de_cuota, huérfanas eliminadas, bytes liberados por ellas).
+        """
+        if not self.quota_bytes:
+            return True, 0, 0
+
+        _, total = self.usage()
+        if total <= self.quota_bytes:
+            return True, 0, 0
+
+        conn = self._connect()
+        candidates = conn.execute('''
+        SELECT filename FROM image_index WHERE recompressed = 0 AND added_at < ? ORDER BY mtime
+        ''', (self._grace_cutoff(),)).fetchall()
+        conn.close()
+
+        for (filename,) in candidates:
+            if total <= self.quota_bytes or self._stop.is_set():
+                break
+            try:
+                total -= self.recompress(filename)
+            except Exception as e:
+                print(f"No se pudo recomprimir {filename}: {e}")
+
+        pruned, freed = 0, 0
+        if total > self.quota_bytes and not self._stop.is_set():
+            pruned, freed = self.prune_orphans()
+            total -= freed
+
+        return total <= self.quota_bytes, pruned, freed
+
+    def run_maintenance(self):
+        """Ejecuta una pasada completa: índice, huérfanas, recompresión y cuota.
+
+        Las imágenes huérfanas se eliminan siempre si `auto_prune` está activo,
+        y si no, solo cuando hace falta para respetar la cuota.
+        """
+        with self._lock:
+            self.refresh()
+            pruned, pruned_bytes = self.prune_orphans() if self.auto_prune else (0, 0)
+            recompressed, recompressed_bytes = self.recompress_old()
+            within_quota, quota_pruned, quota_pruned_bytes = self.enforce_quota()
+            pruned += quota_pruned
+            pruned_bytes += quota_pruned_bytes
+            count, total = self.usage()
+
+        summary = {
+            'pruned': pruned,
+            'pruned_bytes': pruned_bytes,
+            'recompressed': recompressed,
+            'recompressed_bytes': recompressed_bytes,
+            'within_quota': within_quota,
+            'files': count,
+            'total_bytes': total,
+            'finished': datetime.now().isoformat(),
+        }
+        self.last_summary = summary
+        print(f"Mantenimiento de almacenamiento: {summary}")
+        return summary
+
+    # Trabajo en segundo plano
+    def start_background(self, interval_s=3600):
+        """Ejecuta el mantenimiento periódicamente en un hilo en segundo plano."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.run_maintenance()
+                except Exception as e:
+                    print(f"Error en el mantenimiento de almacenamiento: {e}")
+                self._stop.wait(interval_s)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="storage-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop_background(self):
+        """Detiene el hilo de mantenimiento."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import geo
+
+INSIDE = {
+    "Ciudad de Panamá": (8.98, -79.52),
+    "David": (8.43, -82.43),
+    "Colón": (9.36, -79.90),
+    "Bocas del Toro": (9.34, -82.24),
+    "Puerto Armuelles": (8.28, -82.86),
+    "Yaviza": (8.16, -77.69),
+    "Puerto Obaldía": (8.664, -77.418),
+    "Jaqué": (7.52, -78.17),
+    "Isla Taboga": (8.79, -79.55),
+    "Contadora": (8.62, -79.03),
+    "Pedro González": (8.41, -79.10),
+    "Isla del Rey": (8.45, -78.93),
+    "Isla Parida": (8.13, -82.33),
+    "Isla Iguana": (7.63, -80.00),
+}
+
+OUTSIDE = {
+    "Acandí (Colombia)": (8.51, -77.28),
+    "Sapzurro (Colombia)": (8.66, -77.35),
+    "Ciudad Neily (Costa Rica)": (8.65, -82.94),
+    "Pacífico abierto": (7.60, -79.20),
+    "Caribe abierto": (9.50, -80.80),
+}
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return geo.PanamaValidator()
+
+
+@pytest.mark.parametrize("name", INSIDE)
+def test_known_places_inside(validator, name):
+    lat, lon = INSIDE[name]
+    assert validator.validate_point(lat, lon) == (True, None)
+
+
+@pytest.mark.parametrize("name", OUTSIDE)
+def test_known_places_outside(validator, name):
+    lat, lon = OUTSIDE[name]
+    valid, message = validator.validate_point(lat, lon)
+    assert not valid and message
+
+
+def test_invalid_values(validator):
+    _, codes = validator.validate([np.nan, 20.0], [-79.5, -79.5])
+    assert codes.tolist() == [geo.NOT_FINITE, geo.OUT_OF_BOUNDS]
+
+
+def test_province(validator):
+    lat, lon = zip(INSIDE["Isla Taboga"], INSIDE["David"], OUTSIDE["Acandí (Colombia)"])
+    assert validator.province(lat, lon).tolist() == ["Panamá", "Chiriquí", ""]
+
+
+def test_grid_matches_exact_check(validator):
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(validator.min_lat, validator.max_lat, 200000)
+    lon = rng.uniform(validator.min_lon, validator.max_lon, 200000)
+    valid, _ = validator.validate(lat, lon)
+    assert (valid == validator._exact_valid(lat, lon)).all()
+
+
+def test_resolved_cells_are_exact(validator):
+    # Puntos en las esquinas y el centro de cada celda válida o inválida
+    rows, cols = np.nonzero(validator.grid != geo._BORDER)
+    expected = validator.grid[rows, cols] == geo._VALID
+    eps = 1e-9
+    for d_row, d_col in ((eps, eps), (0.5, 0.5), (1 - eps, eps), (eps, 1 - eps), (1 - eps, 1 - eps)):
+        lat = validator.min_lat + (rows + d_row) * validator.cell_deg
+        lon = validator.min_lon + (cols + d_col) * validator.cell_deg
+        assert (validator._exact_valid(lat, lon) == expected).all()
@@ -0,0 +1,104 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import core
+from hotspots import HotspotEngine, convex_hull, haversine_km
+
+EPS_KM = 1.5
+MIN_SAMPLES = 4
+
+
+def sample_points(rng, n=400):
+    """Grupos densos alrededor de algunos centros más puntos dispersos."""
+    centers = rng.uniform([8.0, -81.0], [9.0, -79.0], (6, 2))
+    clustered = np.vstack([c + rng.normal(0, 0.01, (n // 12, 2)) for c in centers])
+    scattered = rng.uniform([8.0, -81.0], [9.0, -79.0], (n - len(clustered), 2))
+    points = np.vstack([clustered, scattered])
+    return points[:, 0], points[:, 1], rng.uniform(0, 180, len(points))
+
+
+def brute_force_dbscan(lat, lon, days, eps_days):
+    """DBSCAN de referencia con la matriz completa de distancias."""
+    near = haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :]) <= EPS_KM
+    if eps_days:
+        near &= np.abs(days[:, None] - days[None, :]) <= eps_days
+    core_points = near.sum(axis=1) >= MIN_SAMPLES
+
+    labels = np.full(len(lat), -1)
+    for start in np.flatnonzero(core_points):
+        if labels[start] >= 0:
+            continue
+        labels[start] = start
+        stack = [start]
+        while stack:
+            i = stack.pop()
+            for j in np.flatnonzero(near[i] & core_points):
+                if labels[j] < 0:
+                    labels[j] = start
+                    stack.append(j)
+    return near, core_points, labels
+
+
+@pytest.mark.parametrize("eps_days", [None, 30])
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_brute_force_in_any_insertion_order(seed, eps_days):
+    rng = np.random.default_rng(seed)
+    lat, lon, days = sample_points(rng)
+    near, core_points, expected = brute_force_dbscan(lat, lon, days, eps_days)
+
+    order = rng.permutation(len(lat))
+    engine = HotspotEngine(eps_km=EPS_KM, eps_days=eps_days, min_samples=MIN_SAMPLES)
+    # Primero una parte y luego el resto, como al llegar avistamientos nuevos
+    half = len(order) // 2
+    for chunk in (order[:half], order[half:]):
+        engine.add_many([(int(i), lat[i], lon[i], days[i], 1) for i in chunk])
+
+    labels = np.empty(len(lat), dtype=np.int64)
+    labels[order] = engine.labels()
+    is_core = np.empty(len(lat), dtype=bool)
+    is_core[order] = engine._core[:len(lat)]
+
+    assert (is_core == core_points).all()
+
+    # Misma partición de los núcleos (las etiquetas pueden tener otros valores)
+    pairs = set(zip(labels[core_points], expected[core_points]))
+    assert len(pairs) == len(set(labels[core_points])) == len(set(expected[core_points]))
+
+    # Un borde pertenece a la zona de alguno de sus núcleos vecinos; sin núcleos es ruido
+    for i in np.flatnonzero(~core_points):
+        neighbour_labels = set(labels[near[i] & core_points])
+        if neighbour_labels:
+            assert labels[i] in neighbour_labels
+        else:
+            assert labels[i] == -1
+
+
+def test_update_from_db_reads_only_new_rows(tmp_path):
+    db_path = str(tmp_path / "sightings.db")
+    core.init_database(db_path)
+    for i in range(6):
+        core.insert_sighting(db_path, 8.98 + i * 1e-4, -79.52, "a.jpg", "a.jpg", 0.9, 2,
+                             timestamp=f"2025-01-0{i + 1}T10:00:00")
+
+    engine = HotspotEngine(eps_km=1.0, eps_days=30, min_samples=5)
+    assert engine.update_from_db(db_path) == 6
+    assert engine.update_from_db(db_path) == 0
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(core.INSERT_SIGHTING_SQL, (8.98, -79.52, "b.jpg", "b.jpg", 0.9, 1, None))
+    conn.commit()
+    conn.close()
+    # Sin fecha no entra al agrupamiento temporal, pero tampoco se vuelve a leer
+    assert engine.update_from_db(db_path) == 0
+    assert engine.update_from_db(db_path) == 0
+
+    (hotspot,) = engine.hotspots()
+    assert hotspot['size'] == 6 and hotspot['iguanas'] == 12
+
+
+def test_convex_hull():
+    points = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0.5, 0.5], [0.5, 0.2]])
+    assert sorted(convex_hull(points)) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert len(convex_hull(np.array([[8.9, -79.5], [8.9, -79.5]]))) == 1
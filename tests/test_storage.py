@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import core
+from storage import StorageManager
+
+DAY = 86400
+
+
+@pytest.fixture
+def paths(tmp_path):
+    db_path = str(tmp_path / "sightings.db")
+    images_dir = tmp_path / "saved"
+    images_dir.mkdir()
+    core.init_database(db_path)
+    return db_path, images_dir
+
+
+def write_image(path, seed=0, size=160, age_days=0):
+    """Imagen de ruido (se comprime mal en PNG) con la fecha indicada."""
+    pixels = np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+    if age_days:
+        stamp = time.time() - age_days * DAY
+        os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+def add_sighting(db_path, saved_path):
+    return core.insert_sighting(db_path, 9.0, -79.5, saved_path, saved_path, 0.9, 1)
+
+
+def saved_paths(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = dict(conn.execute("SELECT id, saved_image_path FROM sightings"))
+    conn.close()
+    return rows
+
+
+def indexed(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = {name for (name,) in conn.execute("SELECT filename FROM image_index")}
+    conn.close()
+    return rows
+
+
+def age_index(db_path, days):
+    """Simula que todas las imágenes llegaron hace `days` días."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE image_index SET added_at = added_at - ?", (days * DAY,))
+    conn.commit()
+    conn.close()
+
+
+def test_recompress_rewrites_sighting_paths(paths):
+    db_path, images_dir = paths
+    source = write_image(images_dir / "a.png")
+    sighting_id = add_sighting(db_path, source)
+    storage = StorageManager(db_path, str(images_dir))
+    storage.refresh()
+
+    assert storage.recompress("a.png") > 0
+    assert not os.path.exists(source)
+    assert saved_paths(db_path)[sighting_id] == str(images_dir / "a.jpg")
+    assert indexed(db_path) == {"a.jpg"}
+
+
+def test_recompress_never_overwrites_existing_file(paths):
+    db_path, images_dir = paths
+    png = add_sighting(db_path, write_image(images_dir / "a.png", seed=1))
+    jpg = add_sighting(db_path, write_image(images_dir / "a.jpg", seed=2))
+    jpg_bytes = (images_dir / "a.jpg").read_bytes()
+    storage = StorageManager(db_path, str(images_dir))
+    storage.refresh()
+
+    assert storage.recompress("a.png") > 0
+    assert (images_dir / "a.jpg").read_bytes() == jpg_bytes
+    rows = saved_paths(db_path)
+    assert rows[jpg] == str(images_dir / "a.jpg")
+    assert rows[png] == str(images_dir / "a_c.jpg")
+    assert indexed(db_path) == {"a.jpg", "a_c.jpg"}
+
+
+def test_grace_period_counts_from_copy_not_photo_date(paths, tmp_path):
+    db_path, images_dir = paths
+    add_sighting(db_path, write_image(images_dir / "kept.png", age_days=90))
+    old_photo = write_image(tmp_path / "old.png", age_days=90)
+    storage = StorageManager(db_path, str(images_dir))
+    storage.refresh()
+
+    # Copiada hace un momento y aún sin avistamiento: no es huérfana todavía
+    storage.add_copy(old_photo, str(images_dir / "new.png"))
+    assert storage.prune_orphans(dry_run=True)[0] == 0
+    assert storage.recompress_old() == (0, 0)
+
+    age_index(db_path, 2)
+    assert storage.prune_orphans()[0] == 1
+    assert not (images_dir / "new.png").exists()
+    assert (images_dir / "kept.png").exists()
+
+
+def test_prune_refuses_without_sightings(tmp_path):
+    # Base distinta a la que referencia la carpeta (p. ej. creada desde otro directorio)
+    db_path = str(tmp_path / "empty.db")
+    core.init_database(db_path)
+    images_dir = tmp_path / "saved"
+    images_dir.mkdir()
+    write_image(images_dir / "a.png")
+    storage = StorageManager(db_path, str(images_dir))
+    storage.refresh()
+    age_index(db_path, 2)
+
+    assert storage.prune_orphans() == (0, 0)
+    assert (images_dir / "a.png").exists()
+
+
+def test_enforce_quota_recompresses_then_prunes_orphans(paths):
+    db_path, images_dir = paths
+    referenced = [write_image(images_dir / f"ref{n}.png", seed=n, age_days=60) for n in range(3)]
+    for path in referenced:
+        add_sighting(db_path, path)
+    write_image(images_dir / "orphan.png", seed=10, age_days=60)
+
+    storage = StorageManager(db_path, str(images_dir), quota_mb=0.001)
+    storage.refresh()
+    age_index(db_path, 2)
+
+    within, pruned, freed = storage.enforce_quota()
+    # La cuota es inalcanzable: se recomprime todo y solo se elimina la huérfana
+    assert not within
+    assert pruned == 1 and freed > 0
+    assert sorted(os.listdir(images_dir)) == ["ref0.jpg", "ref1.jpg", "ref2.jpg"]
+    assert sorted(map(os.path.basename, saved_paths(db_path).values())) == ["ref0.jpg", "ref1.jpg", "ref2.jpg"]
+    assert storage.quota_status()['files'] == 3
+
+
+def test_refresh_skips_unchanged_folder(paths, tmp_path):
+    db_path, images_dir = paths
+    write_image(images_dir / "a.png")
+    storage = StorageManager(db_path, str(images_dir))
+    assert storage.refresh() == 1
+    assert storage.refresh() == 0
+
+    # Los cambios propios ya quedan en el índice y no obligan a recorrer la carpeta
+    storage.add_copy(write_image(tmp_path / "b.png", seed=1), str(images_dir / "b.png"))
+    storage.recompress("a.png")
+    conn = sqlite3.connect(db_path)
+    (dir_mtime,) = conn.execute("SELECT value FROM storage_state WHERE key = 'dir_mtime'").fetchone()
+    conn.close()
+    assert dir_mtime == str(os.stat(images_dir).st_mtime_ns)
+    assert indexed(db_path) == {"a.jpg", "b.png"}
+
+    # Un archivo agregado por fuera sí se detecta
+    time.sleep(0.01)
+    write_image(images_dir / "c.png", seed=2)
+    assert storage.refresh() == 1
+    assert indexed(db_path) == {"a.jpg", "b.png", "c.png"}
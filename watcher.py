@@ -0,0 +1,537 @@
+import os
+import sys
+import time
+import queue
+import signal
+import shutil
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+import cv2
+
+import core
+import geo
+from metrics import metrics
+from prefilter import PrefilterCascade
+
+# watchdog usa inotify en Linux; si no está instalado se revisa la carpeta periódicamente
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+
+# Estados finales registrados en la bitácora de ingesta
+STATE_SAVED = "saved"
+STATE_EMPTY = "empty"
+STATE_NO_COORDS = "no_coords"
+STATE_FAILED = "failed"
+
+
+class _DropFolderHandler(FileSystemEventHandler):
+    """Envía al vigilante los archivos creados, modificados, movidos o eliminados."""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if event.is_directory:
+            # Una carpeta copiada o sincronizada puede llegar ya con imágenes
+            self.watcher.note_tree(event.src_path)
+        else:
+            self.watcher.note(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.note(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self.watcher.forget_tree(event.src_path)
+            self.watcher.note_tree(event.dest_path)
+        else:
+            self.watcher.forget(event.src_path)
+            self.watcher.note(event.dest_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.watcher.forget_tree(event.src_path)
+        else:
+            self.watcher.forget(event.src_path)
+
+
+class DropFolderWatcher:
+    """Ingesta continua de imágenes: decodificar → detectar → EXIF → guardar.
+
+    Cada etapa tiene su propia cantidad de hilos y se comunica con la siguiente
+    mediante colas acotadas, de modo que una ráfaga de archivos nunca acumula más
+    de `queue_size` imágenes decodificadas por etapa. La carpeta se vigila con
+    sus subcarpetas; cada subcarpeta (p. ej. una por cámara trampa) tiene su
+    propio fondo en el prefiltro. La bitácora de ingesta se
+    guarda en la misma transacción que los avistamientos, así que al reiniciar
+    después de una falla solo se reprocesan los archivos sin registrar.
+    """
+
+    def __init__(self, drop_dir, db_path, model, saved_images_dir,
+                 decode_workers=2, exif_workers=1,
+                 queue_size=16, batch_size=4, commit_every=20, commit_interval_s=2.0,
+                 settle_s=2.0, poll_interval_s=2.0, default_coords=None, use_inotify=True,
+                 prefilter=None):
+        self.drop_dir = os.path.abspath(drop_dir)
+        self.db_path = db_path
+        self.model = model
+        self.saved_images_dir = saved_images_dir
+        self._saved_prefix = os.path.join(os.path.abspath(saved_images_dir), "")
+        self.decode_workers = decode_workers
+        self.exif_workers = exif_workers
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.commit_interval_s = commit_interval_s
+        self.settle_s = settle_s
+        self.poll_interval_s = poll_interval_s
+        self.default_coords = default_coords
+        self.use_inotify = use_inotify and Observer is not None
+        self.prefilter = prefilter
+
+        self.decode_queue = queue.Queue(maxsize=queue_size)
+        self.detect_queue = queue.Queue(maxsize=queue_size)
+        self.exif_queue = queue.Queue(maxsize=queue_size)
+        self.store_queue = queue.Queue(maxsize=queue_size)
+
+        # Archivos vistos pero aún no estables: ruta -> (tamaño, mtime, última variación)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # Firma (tamaño, mtime) de los archivos presentes en la carpeta que ya se
+        # enviaron al flujo o están en la bitácora; None si no se han procesado.
+        # Solo guarda archivos que siguen en la carpeta, el resto se consulta en la bitácora.
+        self._known = {}
+        self._known_lock = threading.Lock()
+        self._journal_conn = None
+
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+
+        os.makedirs(self.saved_images_dir, exist_ok=True)
+        core.init_database(self.db_path)
+        self.init_journal()
+
+    # Bitácora de ingesta
+    def init_journal(self):
+        """Crea la tabla de la bitácora y abre la conexión para consultarla por ruta."""
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_journal (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            state TEXT NOT NULL,
+            error TEXT,
+            processed_at TEXT
+        )
+        ''')
+        conn.commit()
+        self._journal_conn = conn
+
+    def known_signature(self, path):
+        """Firma registrada del archivo; consulta la bitácora (indexada por ruta) la primera vez."""
+        with self._known_lock:
+            if path not in self._known:
+                row = self._journal_conn.execute(
+                    "SELECT size, mtime FROM ingest_journal WHERE path = ?", (path,)).fetchone()
+                self._known[path] = tuple(row) if row else None
+            return self._known[path]
+
+    def forget(self, path):
+        """Olvida un archivo que ya no está en la carpeta."""
+        with self._known_lock:
+            self._known.pop(path, None)
+        with self._pending_lock:
+            self._pending.pop(path, None)
+
+    def forget_tree(self, directory):
+        """Olvida todos los archivos de una subcarpeta eliminada o movida."""
+        prefix = os.path.join(directory, "")
+        with self._known_lock:
+            for path in [path for path in self._known if path.startswith(prefix)]:
+                del self._known[path]
+        with self._pending_lock:
+            for path in [path for path in self._pending if path.startswith(prefix)]:
+                del self._pending[path]
+
+    # Detección de archivos nuevos
+    def note(self, path):
+        """Registra un archivo visto en la carpeta; se procesa cuando deja de cambiar."""
+        if not path.lower().endswith(IMAGE_EXTENSIONS):
+            return
+        # Las copias guardadas no se vuelven a ingerir si la carpeta queda dentro de la vigilada
+        if os.path.abspath(path).startswith(self._saved_prefix):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+
+        signature = (stat.st_size, stat.st_mtime)
+        if self.known_signature(path) == signature:
+            return
+
+        with self._pending_lock:
+            previous = self._pending.get(path)
+            if previous is None or previous[:2] != signature:
+                self._pending[path] = (stat.st_size, stat.st_mtime, time.monotonic())
+
+    def note_tree(self, directory):
+        """Registra los archivos de una carpeta y sus subcarpetas; regresa sus rutas."""
+        present = set()
+        stack = [directory]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            present.add(entry.path)
+                            self.note(entry.path)
+            except OSError:
+                # La subcarpeta desapareció mientras se recorría
+                continue
+        return present
+
+    def scan(self):
+        """Revisa la carpeta y sus subcarpetas (al iniciar y como respaldo sin inotify)."""
+        present = self.note_tree(self.drop_dir)
+
+        # Los archivos que ya no están se olvidan; la bitácora conserva su registro
+        with self._known_lock:
+            for path in [path for path in self._known if path not in present]:
+                del self._known[path]
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval_s):
+            try:
+                self.scan()
+            except OSError as e:
+                print(f"Error al revisar la carpeta: {e}")
+
+    def _debounce_loop(self):
+        """Envía al flujo los archivos cuyo tamaño y fecha no cambian durante `settle_s`."""
+        while not self._stop.wait(0.5):
+            now = time.monotonic()
+            with self._pending_lock:
+                candidates = [(path, entry) for path, entry in self._pending.items()
+                              if now - entry[2] >= self.settle_s]
+
+            for path, (size, mtime, _) in candidates:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    with self._pending_lock:
+                        self._pending.pop(path, None)
+                    continue
+
+                with self._pending_lock:
+                    if (stat.st_size, stat.st_mtime) != (size, mtime):
+                        # Todavía se está escribiendo
+                        self._pending[path] = (stat.st_size, stat.st_mtime, now)
+                        continue
+                    self._pending.pop(path, None)
+
+                with self._known_lock:
+                    self._known[path] = (size, mtime)
+                item = {'path': path, 'size': size, 'mtime': mtime}
+                # put bloqueante: si el flujo está lleno, la detección de archivos espera
+                if not self._put(self.decode_queue, item):
+                    return
+
+    # Etapas del flujo
+    def _put(self, target, item):
+        """Encola respetando la contrapresión; regresa False si el vigilante se detiene."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        try:
+            return source.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    def _decode_loop(self):
+        while not self._stop.is_set():
+            item = self._get(self.decode_queue)
+            if item is None:
+                continue
+            with metrics.stage("decode"):
+                image = cv2.imread(item['path'])
+            if image is None:
+                item.update(state=STATE_FAILED, error="No se pudo decodificar la imagen")
+                self._put(self.store_queue, item)
+                continue
+            item['image'] = image
+            self._put(self.detect_queue, item)
+
+    def _detect_loop(self):
+        while not self._stop.is_set():
+            first = self._get(self.detect_queue)
+            if first is None:
+                continue
+
+            # Agrupar lo que ya esté en cola para una sola pasada del modelo
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.detect_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                # Cada subcarpeta se trata como una cámara distinta para el prefiltro
+                results = core.run_detection_batch(
+                    self.model, [item['image'] for item in batch],
+                    prefilter=self.prefilter,
+                    sources=[os.path.dirname(item['path']) for item in batch])
+            except Exception as e:
+                results = [None] * len(batch)
+                error = f"Error en la detección: {e}"
+
+            for item, result in zip(batch, results):
+                # La imagen decodificada ya no se necesita
+                item.pop('image', None)
+                if result is None:
+                    item.update(state=STATE_FAILED, error=error)
+                    self._put(self.store_queue, item)
+                elif not result['is_iguana']:
+                    item.update(state=STATE_EMPTY)
+                    self._put(self.store_queue, item)
+                else:
+                    item['result'] = result
+                    self._put(self.exif_queue, item)
+
+    def _exif_loop(self):
+        validator = geo.get_validator()
+        while not self._stop.is_set():
+            item = self._get(self.exif_queue)
+            if item is None:
+                continue
+
+            try:
+                coords = core.read_gps_coordinates(item['path'])
+            except Exception:
+                coords = None
+            coords = coords or self.default_coords
+
+            # Fecha de captura de la cámara; sin EXIF se usa la fecha del archivo
+            try:
+                captured_at = core.read_capture_time(item['path'])
+            except Exception:
+                captured_at = None
+            item['captured_at'] = captured_at or datetime.fromtimestamp(item['mtime']).isoformat()
+
+            if coords is None:
+                item.update(state=STATE_NO_COORDS, error="La imagen no tiene coordenadas GPS")
+            else:
+                is_valid, error_msg = validator.validate_point(*coords)
+                if is_valid:
+                    item.update(state=STATE_SAVED, coords=coords)
+                else:
+                    item.update(state=STATE_NO_COORDS, error=error_msg)
+            self._put(self.store_queue, item)
+
+    def _store_loop(self):
+        """Guarda avistamientos y bitácora en transacciones agrupadas."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        pending = 0
+        last_commit = time.monotonic()
+
+        while True:
+            item = self._get(self.store_queue)
+            if item is not None:
+                try:
+                    self._store(conn, item)
+                except Exception as e:
+                    print(f"Error al guardar {item['path']}: {e}")
+                    item.update(state=STATE_FAILED, error=str(e))
+                    self._journal(conn, item)
+                pending += 1
+
+            if pending and (pending >= self.commit_every or
+                            time.monotonic() - last_commit >= self.commit_interval_s or
+                            self._stop.is_set()):
+                with metrics.stage("db_commit"):
+                    conn.commit()
+                pending = 0
+                last_commit = time.monotonic()
+
+            if item is None and self._stop.is_set():
+                break
+
+        conn.close()
+
+    def _store(self, conn, item):
+        if item['state'] == STATE_SAVED:
+            saved_path = core.new_saved_image_path(self.saved_images_dir, item['path'])
+            with metrics.stage("copy"):
+                shutil.copy2(item['path'], saved_path)
+
+            lat, lon = item['coords']
+            result = item['result']
+            with metrics.stage("db_insert"):
+                conn.execute(core.INSERT_SIGHTING_SQL, (
+                    lat, lon, item['path'], saved_path,
+                    result['confidence'], result['detections_count'],
+                    item['captured_at']
+                ))
+            metrics.increment("sightings_saved")
+
+        metrics.increment(f"ingest_{item['state']}")
+        self._journal(conn, item)
+
+    def _journal(self, conn, item):
+        conn.execute('''
+        INSERT OR REPLACE INTO ingest_journal (path, size, mtime, state, error, processed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (item['path'], item['size'], item['mtime'], item['state'],
+              item.get('error'), datetime.now().isoformat()))
+
+    # Ciclo de vida
+    def start(self):
+        """Inicia los hilos de cada etapa y la vigilancia de la carpeta."""
+        stages = [
+            (self._decode_loop, self.decode_workers, "decode"),
+            # Un solo hilo de detección: el modelo no se comparte entre hilos;
+            # el rendimiento se ajusta con `batch_size`
+            (self._detect_loop, 1, "detect"),
+            (self._exif_loop, self.exif_workers, "exif"),
+            (self._store_loop, 1, "store"),
+            (self._debounce_loop, 1, "debounce"),
+        ]
+        if not self.use_inotify:
+            stages.append((self._poll_loop, 1, "poll"))
+
+        for target, count, name in stages:
+            for i in range(count):
+                thread = threading.Thread(target=target, name=f"ingest-{name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        # Archivos que llegaron mientras el vigilante estaba detenido
+        self.scan()
+
+        if self.use_inotify:
+            self._observer = Observer()
+            self._observer.schedule(_DropFolderHandler(self), self.drop_dir, recursive=True)
+            self._observer.start()
+
+        print(f"Vigilando {self.drop_dir} ({'inotify' if self.use_inotify else 'sondeo'})")
+
+    def stop(self):
+        """Detiene la vigilancia y espera a que el guardado haga su último commit."""
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+        if self._journal_conn:
+            self._journal_conn.close()
+            self._journal_conn = None
+
+    def status(self):
+        """Tamaño actual de cada cola y de los archivos en espera de estabilizarse."""
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'decode': self.decode_queue.qsize(),
+            'detect': self.detect_queue.qsize(),
+            'exif': self.exif_queue.qsize(),
+            'store': self.store_queue.qsize(),
+        }
+
+
+def parse_coords(value):
+    lat, lon = (float(part) for part in value.split(","))
+    return lat, lon
+
+
+def parse_args(argv=None):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Ingesta automática de imágenes desde una carpeta")
+    parser.add_argument("drop_dir", help="Carpeta donde llegan las imágenes")
+    parser.add_argument("--db", default="iguana_sightings.db", help="Base de datos de avistamientos")
+    parser.add_argument("--model", default=os.path.join(base_dir, "yolo_model", "best.pt"))
+    parser.add_argument("--saved-dir", default=os.path.join(base_dir, "saved_sightings"))
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument("--exif-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=16, help="Capacidad de cada cola")
+    parser.add_argument("--batch-size", type=int, default=4, help="Imágenes por pasada del modelo")
+    parser.add_argument("--commit-every", type=int, default=20)
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="Segundos sin cambios antes de procesar un archivo")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--no-inotify", action="store_true", help="Usa sondeo en lugar de inotify")
+    parser.add_argument("--default-coords", type=parse_coords, metavar="LAT,LON",
+                        help="Coordenadas para imágenes sin GPS (por ejemplo, una cámara trampa fija)")
+    parser.add_argument("--prefilter", type=float, nargs="?", const=0.004, metavar="UMBRAL",
+                        help="Descarta cuadros vacíos antes de YOLO (umbral menor = más seguro)")
+    parser.add_argument("--metrics-dump", metavar="ARCHIVO",
+                        help="Guarda las métricas al detenerse (.json o .prom)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics_dump:
+        metrics.enabled = True
+
+    try:
+        model = core.load_model(args.model)
+    except Exception as e:
+        print(f"No se pudo cargar el modelo YOLO: {e}")
+        return 1
+
+    watcher = DropFolderWatcher(
+        args.drop_dir, args.db, model, args.saved_dir,
+        decode_workers=args.decode_workers,
+        exif_workers=args.exif_workers,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        commit_every=args.commit_every,
+        settle_s=args.settle,
+        poll_interval_s=args.poll_interval,
+        default_coords=args.default_coords,
+        use_inotify=not args.no_inotify,
+        prefilter=PrefilterCascade(threshold=args.prefilter) if args.prefilter is not None else None,
+    )
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    watcher.start()
+    while not stop.wait(30):
+        print(f"Estado de la ingesta: {watcher.status()}")
+
+    print("Deteniendo la ingesta...")
+    watcher.stop()
+    if watcher.prefilter:
+        print(f"Prefiltro: {watcher.prefilter.stats()}")
+    if args.metrics_dump:
+        metrics.dump(args.metrics_dump)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())